@@ -31,7 +31,10 @@ from sugar3.graphics.toolbarbox import ToolbarBox
 from sugar3.activity.widgets import ActivityToolbarButton
 from sugar3.activity.widgets import StopButton
 from sugar3.activity.widgets import ToolButton
-import g
+from sugar3.graphics.toggletoolbutton import ToggleToolButton
+from sugar3.graphics.toolcombobox import ToolComboBox
+from gettext import gettext as _
+import ai
 
 import sugargame.canvas
 
@@ -53,12 +56,8 @@ class ConnectFour(Activity):
         )
         self.set_canvas(self._pygamecanvas)
         self.game.set_canvas(self._pygamecanvas)
-        
-        # Now initialize pygame and g module
-        pygame.init()
-        g.WIN = pygame.display.get_surface()
-        g.init()
-        
+
+        # pygame and g are set up by Main.run() once the canvas exists
         self._pygamecanvas.grab_focus()
 
     def build_toolbar(self):
@@ -77,6 +76,27 @@ class ConnectFour(Activity):
         toolbar_box.toolbar.insert(help_button, -1)
         help_button.show()
 
+        computer_button = ToggleToolButton('computer-xo')
+        computer_button.set_tooltip(_('Play against the computer'))
+        computer_button.connect('toggled', self._computer_cb)
+        toolbar_box.toolbar.insert(computer_button, -1)
+        computer_button.show()
+
+        level_combo = ToolComboBox(label_text=_('Level:'))
+        labels = {
+            'easy': _('Easy'),
+            'medium': _('Medium'),
+            'hard': _('Hard'),
+            'expert': _('Expert'),
+        }
+        for i, level in enumerate(ai.LEVELS):
+            level_combo.combo.append_item(level, labels[level])
+            if level == ai.DEFAULT_LEVEL:
+                level_combo.combo.set_active(i)
+        level_combo.combo.connect('changed', self._level_cb)
+        toolbar_box.toolbar.insert(level_combo, -1)
+        level_combo.show()
+
         separator = Gtk.SeparatorToolItem()
         separator.props.draw = False
         separator.set_expand(True)
@@ -99,3 +119,9 @@ class ConnectFour(Activity):
 
     def _help_cb(self, button):
         self.game.show_help = not self.game.show_help
+
+    def _computer_cb(self, button):
+        self.game.set_computer(button.get_active())
+
+    def _level_cb(self, combo):
+        self.game.set_level(combo.get_value())
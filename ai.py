@@ -0,0 +1,369 @@
+# ai.py
+
+"""Computer opponent for Connect Four.
+
+The engine runs a negamax search with alpha-beta pruning on the same
+bitboard layout as board.Board. Positions are seen from the side to
+move: `position` holds that player's tokens and `mask` holds every
+token on the board, so playing a move is a couple of integer
+operations and the search never has to copy a grid.
+"""
+
+import random
+import time
+
+# Search depth for each difficulty level
+LEVELS = {
+    "easy": 2,
+    "medium": 4,
+    "hard": 6,
+    "expert": 10,
+}
+DEFAULT_LEVEL = "hard"
+
+WIN_SCORE = 100000
+
+# Transposition table entry flags
+EXACT = 0
+LOWER = 1
+UPPER = 2
+
+
+class SearchTimeout(Exception):
+    """Raised inside the search once its deadline has passed"""
+
+
+def popcount(x):
+    return bin(x).count("1")
+
+
+class TranspositionTable:
+    """Fixed size hash table of search results.
+
+    Slots are picked from the low bits of the Zobrist key. An entry is
+    only replaced by a search that is at least as deep, unless it was
+    written during an earlier move, so the expensive results near the
+    root survive the flood of shallow entries from the leaves.
+    """
+
+    def __init__(self, size=1 << 18):
+        # Round the size down to a power of two so that a mask can be
+        # used instead of a modulo.
+        self.size = 1 << (size.bit_length() - 1)
+        self.clear()
+
+    def clear(self):
+        self.entries = [None] * self.size
+        self.generation = 0
+
+    def new_search(self):
+        self.generation += 1
+
+    def get(self, key):
+        entry = self.entries[key & (self.size - 1)]
+        if entry is not None and entry[0] == key:
+            return entry
+        return None
+
+    def put(self, key, depth, flag, value, move):
+        slot = key & (self.size - 1)
+        entry = self.entries[slot]
+        if (entry is None or entry[0] == key or depth >= entry[1] or
+                entry[5] != self.generation):
+            self.entries[slot] = (key, depth, flag, value, move,
+                                  self.generation)
+
+
+class Engine:
+    def __init__(self, rows, cols, level=DEFAULT_LEVEL, table_size=1 << 18,
+                 seed=0, book=None, connect=4):
+        self.rows = rows
+        self.cols = cols
+        self.connect = connect
+        self.height = rows + 1
+        self.level = level
+        self.seed = seed
+        self.book = book  # Optional book.OpeningBook
+        self.table = TranspositionTable(table_size)
+        self.nodes = 0
+        self.deadline = None  # perf_counter() time to give up searching
+
+        h = self.height
+        self.bottom = sum(1 << (col * h) for col in range(cols))
+        self.board_mask = self.bottom * ((1 << rows) - 1)
+        self.column_masks = [((1 << rows) - 1) << (col * h)
+                             for col in range(cols)]
+
+        # Try the center columns first, they take part in the most lines
+        self.order = sorted(range(cols), key=lambda c: abs(2 * c - cols + 1))
+        center = cols // 2
+        self.center_mask = self.column_masks[center]
+        if cols % 2 == 0:
+            self.center_mask |= self.column_masks[center - 1]
+
+        # Zobrist keys for every cell, one set per player, plus a key
+        # for the side to move
+        rng = random.Random(seed)
+        self.zobrist = [
+            [rng.getrandbits(64) for _ in range(cols * h)]
+            for _ in range(2)
+        ]
+        self.side_key = rng.getrandbits(64)
+
+    @property
+    def depth(self):
+        return LEVELS[self.level]
+
+    def set_level(self, level):
+        if level not in LEVELS:
+            raise ValueError("Unknown level %r" % level)
+        self.level = level
+
+    def position(self, board, player):
+        """Convert a board into (position, mask, count, key) for player"""
+        side = board.index(player)
+        position = board.masks[side]
+        mask = board.masks[0] | board.masks[1]
+        return position, mask, board.count, self.position_key(
+            position, mask, side)
+
+    def position_key(self, position, mask, side):
+        """Zobrist key of a position, side is the index of the mover"""
+        key = self.side_key if side else 0
+        for index, m in ((side, position), (1 - side, position ^ mask)):
+            while m:
+                bit = m & -m
+                m ^= bit
+                key ^= self.zobrist[index][bit.bit_length() - 1]
+        return key
+
+    def winning_cells(self, position, mask):
+        """Empty cells that would complete a line for position"""
+        if self.connect != 4:
+            return self.winning_cells_n(position, mask)
+
+        # Vertical
+        r = (position << 1) & (position << 2) & (position << 3)
+
+        # Horizontal and both diagonals
+        for shift in (self.height, self.height - 1, self.height + 1):
+            p = (position << shift) & (position << 2 * shift)
+            r |= p & (position << 3 * shift)
+            r |= p & (position >> shift)
+            p = (position >> shift) & (position >> 2 * shift)
+            r |= p & (position << shift)
+            r |= p & (position >> 3 * shift)
+
+        return r & (self.board_mask ^ mask)
+
+    def winning_cells_n(self, position, mask):
+        """winning_cells() for any line length, slower than the one for 4"""
+        n = self.connect - 1
+
+        # Vertical, n tokens right below the cell
+        r = position << 1
+        for i in range(2, n + 1):
+            r &= position << i
+
+        # Horizontal and both diagonals: i tokens on one side of the
+        # cell and n - i on the other
+        for shift in (self.height, self.height - 1, self.height + 1):
+            before = [-1]  # -1 has every bit set
+            after = [-1]
+            for i in range(1, n + 1):
+                before.append(before[-1] & (position << i * shift))
+                after.append(after[-1] & (position >> i * shift))
+            for i in range(n + 1):
+                r |= before[i] & after[n - i]
+
+        return r & (self.board_mask ^ mask)
+
+    def evaluate(self, position, mask):
+        """Heuristic score for the side to move"""
+        opponent = position ^ mask
+        mine = popcount(self.winning_cells(position, mask))
+        theirs = popcount(self.winning_cells(opponent, mask))
+        center = (popcount(position & self.center_mask) -
+                  popcount(opponent & self.center_mask))
+        return 8 * (mine - theirs) + center
+
+    def best_move(self, board, player, depth=None, order=None):
+        """Pick a column for player to play on board"""
+        if depth is None:
+            depth = self.depth
+        self.table.new_search()
+        return self.root_search(board, player, depth, order)
+
+    def root_search(self, board, player, depth, order=None):
+        """best_move() within the current table generation"""
+        self.nodes = 0
+        position, mask, count, key = self.position(board, player)
+        possible = (mask + self.bottom) & self.board_mask
+        if not possible:
+            return None
+
+        col = self.quick_move(position, mask)
+        if col is not None:
+            return col
+
+        side = board.index(player)
+        best_col = None
+        best_score = -WIN_SCORE - 1
+        alpha = -WIN_SCORE - 1
+        for col in order or self.order:
+            move = possible & self.column_masks[col]
+            if not move:
+                continue
+            score = -self.negamax(
+                position ^ mask, mask | move, count + 1,
+                self.child_key(key, side, move), 1 - side,
+                depth - 1, -WIN_SCORE - 1, -alpha,
+            )
+            if score > best_score:
+                best_score = score
+                best_col = col
+            alpha = max(alpha, score)
+        return best_col
+
+    def search(self, board, player, depth=None, budget=None, helper=0,
+               generation=None):
+        """Iterative deepening search limited to budget seconds.
+
+        Returns (column, depth) of the deepest iteration that finished;
+        the first iteration always runs to completion. helper rotates the
+        root move order so that several processes sharing one table
+        explore different moves first.
+
+        All iterations are one table generation, so the deep entries of
+        one iteration are kept for the next. Processes sharing a table
+        pass the same generation, otherwise a new one is started.
+        """
+        if depth is None:
+            depth = self.depth
+        if generation is None:
+            self.table.new_search()
+        else:
+            self.table.generation = generation
+        start = time.perf_counter()
+        nodes = 0
+
+        position, mask, count, key = self.position(board, player)
+        col = self.quick_move(position, mask)
+        if col is not None:
+            self.nodes = 0
+            return col, depth
+
+        shift = helper % self.cols
+        order = self.order[shift:] + self.order[:shift]
+        best = (None, 0)
+        try:
+            for d in range(1, depth + 1):
+                col = self.root_search(board, player, d, order)
+                nodes += self.nodes
+                best = (col, d)
+                # Search the best move of this iteration first next time
+                order = [col] + [c for c in order if c != col]
+                if budget is not None:
+                    self.deadline = start + budget
+        except SearchTimeout:
+            nodes += self.nodes
+        finally:
+            self.deadline = None
+        self.nodes = nodes
+        return best
+
+    def quick_move(self, position, mask):
+        """A move found without searching: an immediate win or a book move"""
+        possible = (mask + self.bottom) & self.board_mask
+        wins = self.winning_cells(position, mask) & possible
+        for col in self.order:
+            if wins & self.column_masks[col]:
+                return col
+
+        if self.book is not None:
+            return self.book.best_move(self, position, mask)
+        return None
+
+    def child_key(self, key, side, move):
+        return (key ^ self.zobrist[side][move.bit_length() - 1] ^
+                self.side_key)
+
+    def negamax(self, position, mask, count, key, side, depth, alpha, beta):
+        self.nodes += 1
+        if (self.deadline is not None and not self.nodes & 1023 and
+                time.perf_counter() > self.deadline):
+            raise SearchTimeout()
+
+        possible = (mask + self.bottom) & self.board_mask
+        if not possible:
+            return 0  # Draw, the board is full
+
+        # Win on the next move
+        if self.winning_cells(position, mask) & possible:
+            return WIN_SCORE - count - 1
+
+        if depth <= 0:
+            return self.evaluate(position, mask)
+
+        # Block the opponent's immediate wins
+        opponent = position ^ mask
+        threats = self.winning_cells(opponent, mask)
+        forced = possible & threats
+        if forced:
+            if forced & (forced - 1):
+                return -(WIN_SCORE - count - 2)  # Two threats, can't block
+            possible = forced
+        # Never play right below a cell the opponent wins with
+        possible &= ~(threats >> 1)
+        if not possible:
+            return -(WIN_SCORE - count - 2)
+
+        original_alpha = alpha
+        best_move = None
+        entry = self.table.get(key)
+        if entry is not None:
+            if entry[1] >= depth:
+                flag, value = entry[2], entry[3]
+                if flag == EXACT:
+                    return value
+                if flag == LOWER:
+                    alpha = max(alpha, value)
+                elif flag == UPPER:
+                    beta = min(beta, value)
+                if alpha >= beta:
+                    return value
+            best_move = entry[4]
+
+        # Center first, then the moves that create the most threats
+        moves = []
+        for rank, col in enumerate(self.order):
+            move = possible & self.column_masks[col]
+            if move:
+                threat_count = popcount(
+                    self.winning_cells(position | move, mask | move))
+                moves.append((move != best_move, -threat_count, rank, move))
+        moves.sort()
+
+        best = -WIN_SCORE - 1
+        for _, _, _, move in moves:
+            score = -self.negamax(
+                opponent, mask | move, count + 1,
+                self.child_key(key, side, move), 1 - side,
+                depth - 1, -beta, -alpha,
+            )
+            if score > best:
+                best = score
+                best_move = move
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        break
+
+        if best <= original_alpha:
+            flag = UPPER
+        elif best >= beta:
+            flag = LOWER
+        else:
+            flag = EXACT
+        self.table.put(key, depth, flag, best, best_move)
+        return best
@@ -5,6 +5,100 @@ from math import sqrt
 import g
 
 
+# Samples per easing lookup table, the tables are filled in below Animate
+EASING_STEPS = 1024
+EASING_TABLES = {}
+
+# Pre-rendered tokens, see sprite()
+_sprite_cache = {}
+_sprite_scale = None
+
+
+def sprite(color, radius, width=0):
+    """Token drawn once into a surface and reused for every blit.
+
+    With width > 0 only a ring of that width is colored and the inside
+    is black. The edges are smoothed by drawing the token
+    g.TOKEN_SUPERSAMPLE times larger and scaling it down. The cache is
+    dropped when the token radius or the board scale changes.
+    """
+    global _sprite_scale
+    scale = (g.CIRCLE_RADIUS, g.FRAME_GAP, g.TOKEN_SUPERSAMPLE)
+    if scale != _sprite_scale:
+        _sprite_cache.clear()
+        _sprite_scale = scale
+
+    key = (tuple(color), radius, width)
+    surface = _sprite_cache.get(key)
+    if surface is not None:
+        return surface
+
+    # One pixel of margin around the circle for the smoothed edge
+    factor = g.TOKEN_SUPERSAMPLE
+    size = 2 * radius + 2
+    surface = pg.Surface((size * factor, size * factor), pg.SRCALPHA)
+    center = ((radius + 1) * factor, (radius + 1) * factor)
+    pg.draw.circle(surface, color, center, radius * factor)
+    if width > 0:
+        pg.draw.circle(surface, g.BLACK, center, (radius - width) * factor)
+    if factor > 1:
+        surface = pg.transform.smoothscale(surface, (size, size))
+    if pg.display.get_surface() is not None:
+        surface = surface.convert_alpha()
+    _sprite_cache[key] = surface
+    return surface
+
+
+def draw_token(color, center, radius=None, width=0):
+    """Blit the cached token with its center at center"""
+    if radius is None:
+        radius = g.CIRCLE_RADIUS
+    g.WIN.blit(sprite(color, radius, width),
+               (int(center[0]) - radius - 1, int(center[1]) - radius - 1))
+
+
+class Timeline:
+    """Drives every running Animate from one clock sample per frame.
+
+    Only running animations are stepped. Once an animation is finished
+    it leaves the timeline and its owner just keeps drawing its final
+    state, so the cost per frame depends on the number of running
+    animations, not on how many were ever created.
+    """
+
+    def __init__(self):
+        self.now = pg.time.get_ticks()
+        self.running = []
+        self.changed = []  # Animations that moved in the last tick
+
+    def add(self, animation):
+        if not animation.scheduled:
+            animation.scheduled = True
+            self.running.append(animation)
+            # Draw it in the next frame, even before it is stepped
+            self.changed.append(animation)
+
+    def tick(self, now=None):
+        """Step the running animations to now, pygame's clock by default"""
+        self.now = pg.time.get_ticks() if now is None else now
+        for animation in self.changed:
+            animation.changed = False
+        self.changed = self.running
+
+        running = []
+        for animation in self.changed:
+            animation.step(self.now)
+            animation.changed = True
+            if animation.active():
+                running.append(animation)
+            else:
+                animation.scheduled = False
+        self.running = running
+
+
+timeline = Timeline()
+
+
 class Animate:
 
     def LINEAR(x):
@@ -20,24 +114,30 @@ class Animate:
         self.main = main
         self.color = color
         self.function = fn
+        self.table = EASING_TABLES.get(fn)
         self.remove = False
         self.dur = dur
-        self.start_time = pg.time.get_ticks()
+        self.start_time = timeline.now
         self.final_time = self.start_time + dur
         self.type = None
         self.sub_animations = None
+        self.scheduled = False
+        self.changed = True
 
-    def line(self, p1, p2, width=g.LINE_WIDTH):
+    def line(self, p1, p2, width=None):
         self.type = "line"
         self.finished = False
-        self.width = width
+        self.width = g.LINE_WIDTH if width is None else width
         self.p1 = pg.Vector2(p1)
         self.p2 = pg.Vector2(p2)
         self.p = self.p2 - self.p1
         self.length = sqrt(self.p.x ** 2 + self.p.y ** 2)
+        timeline.add(self)
         return self
 
-    def circle(self, center, radius=g.CIRCLE_RADIUS, width=g.CIRCLE_WIDTH):
+    def circle(self, center, radius=None, width=g.CIRCLE_WIDTH):
+        if radius is None:
+            radius = g.CIRCLE_RADIUS  # Scaled to the board by g.init()
         self.type = "circle"
         self.finished = False
         self.width = width
@@ -51,6 +151,7 @@ class Animate:
         self.original_center_y = self.center.y
         self.drop_start = self.center.y - g.GRID_ROWS * g.FRAME_GAP
         self.center.y = self.drop_start
+        timeline.add(self)
         return self
 
     def cross(self, center, length=g.CROSS_LENGTH, width=g.CROSS_WIDTH):
@@ -81,52 +182,86 @@ class Animate:
         self.finished = True
         self.remove = True
         self.dur = dur
-        self.start_time = pg.time.get_ticks()
+        self.start_time = timeline.now
         self.final_time = self.start_time + self.dur
         if self.sub_animations is not None:
             for i in self.sub_animations:
                 i.setup_remove(dur)
+        else:
+            timeline.add(self)
 
-    def update(self, skip=False):
-        # Call method recursively
+    def active(self):
+        """True while the animation changes from one frame to the next"""
         if self.type == "cross":
-            for animation in self.sub_animations:
-                animation.update()
+            return any(i.active() for i in self.sub_animations)
+        return not self.finished or self.remove
+
+    def extent(self):
+        """Rect covering everything the animation draws from start to end"""
+        if self.type == "cross":
+            rects = [i.extent() for i in self.sub_animations]
+            return rects[0].unionall(rects[1:])
+        if self.type == "line":
+            left = min(self.p1.x, self.p2.x)
+            top = min(self.p1.y, self.p2.y)
+            size = self.p2 - self.p1
+            rect = pg.Rect(left, top, abs(size.x) + 1, abs(size.y) + 1)
+            return rect.inflate(2 * self.width, 2 * self.width)
+        top = min(self.drop_start, self.original_center_y) - self.radius
+        drop = abs(self.original_center_y - self.drop_start)
+        return pg.Rect(
+            self.center.x - self.radius - 1,
+            top - 1,
+            2 * self.radius + 3,
+            drop + 2 * self.radius + 3,
+        )
+
+    def ease(self, fraction):
+        if self.table is not None:
+            return self.table[int(fraction * (EASING_STEPS - 1))]
+        return self.function(fraction)
+
+    def step(self, now, skip=False):
+        """Advance the animation to the time now"""
+        if self.type == "cross" or (self.finished and not self.remove):
             return
 
-        # Calculate the animation
-        if not self.finished or self.remove:
-            if pg.time.get_ticks() < self.final_time and not skip:
-                fraction = (pg.time.get_ticks() - self.start_time) / self.dur
-                if fraction < 0.01:
-                    fraction += 0.008
+        if now < self.final_time and not skip:
+            fraction = (now - self.start_time) / self.dur
+            if fraction < 0.01:
+                fraction += 0.008
+
+            if self.remove:
+                fraction = 1 - fraction
+            eased = self.ease(fraction)
 
+            if self.type == "line":
+                self.p.scale_to_length(self.length * eased)
+            elif self.type == "circle":
+                if not self.remove and not self.finished:
+                    # Drop animation for tokens
+                    drop_distance = self.original_center_y - self.drop_start
+                    self.center.y = self.drop_start + drop_distance * eased
+                self.r = self.radius - self.width * eased
+        else:
+            if self.type == "line":
+                self.p = self.p2 - self.p1
                 if self.remove:
-                    fraction = 1 - fraction
-
-                if self.type == "line":
-                    self.p.scale_to_length(
-                        self.length * self.function(fraction)
-                    )
-                elif self.type == "circle":
-                    if not self.remove and not self.finished:
-                        # Drop animation for tokens
-                        drop_distance = self.original_center_y - self.drop_start
-                        self.center.y = self.drop_start + drop_distance * self.function(fraction)
-                    self.r = self.radius - self.width * self.function(fraction)
-            else:
-                if self.type == "line":
-                    self.p = self.p2 - self.p1
-                    if self.remove:
-                        self.p = [0, 0]
-                if self.type == "circle":
-                    if not self.remove:
-                        self.center.y = self.original_center_y
-                    self.r = self.radius - self.width
-                    if self.remove:
-                        self.r = self.radius
-                self.remove = False
-                self.finished = True
+                    self.p = [0, 0]
+            if self.type == "circle":
+                if not self.remove:
+                    self.center.y = self.original_center_y
+                self.r = self.radius - self.width
+                if self.remove:
+                    self.r = self.radius
+            self.remove = False
+            self.finished = True
+
+    def draw(self):
+        if self.type == "cross":
+            for animation in self.sub_animations:
+                animation.draw()
+            return
 
         # Draw stuff
         if self.type == "line":
@@ -136,16 +271,14 @@ class Animate:
                          self.p + self.p1,
                          self.width)
         elif self.type == "circle":
-            pg.draw.circle(
-                g.WIN,
-                self.color,
-                (int(self.center.x), int(self.center.y)),
-                int(self.radius),
-            )
-            if self.width > 0:  # Only draw inner circle if width > 0
-                pg.draw.circle(
-                    g.WIN,
-                    g.BLACK,
-                    (int(self.center.x), int(self.center.y)),
-                    int(self.r)
-                )
\ No newline at end of file
+            width = 0
+            if self.width > 0:  # Ring around a black inside
+                width = max(1, int(self.radius) - int(self.r))
+            draw_token(self.color, self.center, int(self.radius), width)
+
+
+# Lookup tables for the quartic easing functions
+EASING_TABLES.update({
+    fn: [fn(i / (EASING_STEPS - 1)) for i in range(EASING_STEPS)]
+    for fn in (Animate.EASE_OUT_QUART, Animate.EASE_IO_QUART)
+})
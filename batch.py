@@ -0,0 +1,142 @@
+# batch.py
+
+"""Win detection and evaluation for many boards at once with NumPy.
+
+Boards are given as an (N, rows, cols) int8 array in the layout of
+Board.grid(): row 0 is the top, 1 and -1 are the players' tokens and 0
+is an empty cell. Every line of `connect` cells is looked at through
+sliding window sums, one array operation per direction and offset, so
+thousands of boards cost about as much Python as one.
+
+The results agree exactly with Board.is_win() and Engine.evaluate(),
+this module only exists to compute them faster in bulk.
+"""
+
+import numpy as np
+
+# Row and column steps of the four directions
+DIRECTIONS = ((1, 0), (0, 1), (1, 1), (1, -1))
+
+
+def to_array(boards):
+    """Stack Board objects into an (N, rows, cols) int8 array"""
+    return np.array([board.cells for board in boards], dtype=np.int8)
+
+
+def _windows(shape, dr, dc, connect):
+    """Slices of the cells at offsets 0..connect-1 of every window"""
+    rows, cols = shape
+    height = rows - (connect - 1) * dr
+    width = cols - (connect - 1) * abs(dc)
+    if height <= 0 or width <= 0:
+        return []
+    left = (connect - 1) if dc < 0 else 0
+    return [
+        (slice(k * dr, k * dr + height),
+         slice(left + k * dc, left + k * dc + width))
+        for k in range(connect)
+    ]
+
+
+def _cells(boards):
+    """The boards as a (rows, cols, N) array.
+
+    With the boards on the last axis every window slice is a run of
+    contiguous memory, which makes the array operations much faster.
+    """
+    boards = np.asarray(boards, dtype=np.int8)
+    return np.ascontiguousarray(boards.transpose(1, 2, 0))
+
+
+def _window_sums(cells, connect):
+    """Yield (direction, windows, sums) for the four directions.
+
+    Player 1 counts 1 and player -1 counts connect + 1, so one sum
+    tells how many tokens of each player a window holds.
+    """
+    weight = connect + 1
+    dtype = np.int8 if weight * connect <= 127 else np.int16
+    codes = (cells == 1).astype(dtype)
+    codes += (cells == -1).astype(dtype) * dtype(weight)
+    for dr, dc in DIRECTIONS:
+        windows = _windows(cells.shape[:2], dr, dc, connect)
+        if not windows:
+            continue
+        rows, cols = windows[0]
+        total = codes[rows, cols].copy()
+        for rows, cols in windows[1:]:
+            total += codes[rows, cols]
+        yield (dr, dc), windows, total
+
+
+def winners(boards, connect=4):
+    """1 or -1 for boards with a line of that player, 0 otherwise.
+
+    Boards with lines of both players report player 1.
+    """
+    cells = _cells(boards)
+    ones = np.zeros(cells.shape[2], dtype=bool)
+    others = np.zeros(cells.shape[2], dtype=bool)
+    for _, _, total in _window_sums(cells, connect):
+        ones |= (total == connect).any(axis=(0, 1))
+        others |= (total == connect * (connect + 1)).any(axis=(0, 1))
+    return np.where(ones, 1, np.where(others, -1, 0)).astype(np.int8)
+
+
+def legal_moves(boards):
+    """(N, cols) bool array of the columns that still have room"""
+    boards = np.asarray(boards, dtype=np.int8)
+    return boards[:, 0, :] == 0
+
+
+def _winning_cells(cells, connect):
+    """Winning cells of both players, keyed by player"""
+    empty = cells == 0
+    # connect - 1 tokens of the player and one empty cell
+    threats = {1: connect - 1, -1: (connect - 1) * (connect + 1)}
+    result = {player: np.zeros(cells.shape, dtype=bool)
+              for player in threats}
+    for (dr, dc), windows, total in _window_sums(cells, connect):
+        if dc == 0:
+            windows = windows[:1]  # Only the top of a column
+        for player, value in threats.items():
+            threat = total == value
+            found = result[player]
+            for rows, cols in windows:
+                found[rows, cols] |= threat & empty[rows, cols]
+    return result
+
+
+def winning_cells(boards, player, connect=4):
+    """(N, rows, cols) bool array of the empty cells that would
+    complete a line for player.
+
+    Like Engine.winning_cells() a vertical line only counts when the
+    tokens are below the empty cell.
+    """
+    found = _winning_cells(_cells(boards), connect)[player]
+    return found.transpose(2, 0, 1)
+
+
+def evaluate(boards, players, connect=4):
+    """Engine.evaluate() of every board for the side to move.
+
+    players is the side to move, one for all boards or one per board.
+    """
+    cells = _cells(boards)
+    players = np.broadcast_to(np.asarray(players, dtype=np.int32),
+                              (cells.shape[2],))
+    threats = {
+        player: np.count_nonzero(found, axis=(0, 1))
+        for player, found in _winning_cells(cells, connect).items()
+    }
+    mine = np.where(players == 1, threats[1], threats[-1])
+    theirs = np.where(players == 1, threats[-1], threats[1])
+
+    # Same center columns as Engine
+    cols = cells.shape[1]
+    center = [cols // 2]
+    if cols % 2 == 0:
+        center.append(cols // 2 - 1)
+    tokens = cells[:, center].sum(axis=(0, 1), dtype=np.int32)
+    return 8 * (mine - theirs) + tokens * players
@@ -0,0 +1,356 @@
+# bench.py
+
+"""Benchmarks of the rules, the search, the animations and the drawing
+code.
+
+Everything runs headless with the SDL dummy video driver and a fixed
+random seed, so two runs on the same machine measure the same work.
+Each benchmark is repeated and the best run is kept. Results are
+written as JSON and can be compared against an earlier run:
+
+    python3 bench.py -o before.json
+    ... change something ...
+    python3 bench.py --baseline before.json
+
+Benchmarks that need the game window (Main.draw and the startup time)
+are skipped when GTK isn't available.
+"""
+
+import os
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import argparse
+import json
+import platform
+import random
+import subprocess
+import sys
+import time
+import timeit
+
+import pygame as pg
+
+import ai
+import g
+from anim import timeline
+from board import Board
+from frame import Frame
+from game import Game
+
+WIDTH, HEIGHT = 1200, 900
+
+# Units and whether a larger value is better
+RATE = ("ops/s", True)
+TIME = ("ms", False)
+
+
+def best_time(fn, number, repeat):
+    """Seconds per call of fn, the best of repeat runs"""
+    return min(timeit.repeat(fn, number=number, repeat=repeat)) / number
+
+
+def random_games(count, rows=6, cols=7, seed=0):
+    """Finished random games, played with a fixed seed"""
+    rng = random.Random(seed)
+    games = []
+    for _ in range(count):
+        game = Game(rows, cols)
+        while not game.is_over():
+            game.play(rng.choice(game.legal_moves()))
+        games.append(game)
+    return games
+
+
+def bench_win_checks(repeat):
+    # Replay the games and check every move, like the game does
+    boards = [(Board(6, 7), game.history) for game in random_games(200)]
+    checks = sum(len(history) for _, history in boards)
+
+    def run():
+        for board, history in boards:
+            board.reset()
+            player = 1
+            for col in history:
+                board.winning_line(board.play(col, player), col)
+                player = -player
+
+    return checks / best_time(run, 1, repeat)
+
+
+def bench_move_generation(repeat):
+    games = random_games(200)
+    for game in games:
+        # Take back half of the moves to get boards with open columns
+        for _ in range(len(game.history) // 2):
+            game.unplay()
+
+    def run():
+        for game in games:
+            game.legal_moves()
+
+    return len(games) / best_time(run, 10, repeat)
+
+
+def bench_playouts(repeat):
+    rng = random.Random(0)
+    game = Game(6, 7)
+
+    def run():
+        game.new_game()
+        while not game.is_over():
+            game.play(rng.choice(game.legal_moves()))
+
+    return 1 / best_time(run, 100, repeat)
+
+
+def bench_search(repeat):
+    board = Board(6, 7)
+    for col in (3, 3, 2, 4):
+        board.play(col, 1 if board.count % 2 == 0 else -1)
+    engine = ai.Engine(6, 7, "hard")
+
+    def run():
+        engine.table.clear()
+        engine.best_move(board, 1, 8)
+
+    seconds = best_time(run, 1, repeat)
+    return engine.nodes / seconds
+
+
+def fill(frame):
+    """Put a token in every cell of frame, without animation"""
+    for row in range(g.GRID_ROWS):
+        for col in range(g.GRID_COLS):
+            player = 1 if (row + col // 2) % 2 else -1
+            frame.add_token(row, col, player, False)
+
+
+def new_frame(full):
+    """A frame with its intro finished, every cell filled if full"""
+    timeline.__init__()
+    frame = Frame(None, (WIDTH / 2, HEIGHT / 2))
+    for animation in frame.animations:
+        animation.step(timeline.now, skip=True)
+    if full:
+        fill(frame)
+    timeline.tick()
+    return frame
+
+
+def bench_frame_draw(repeat, full):
+    frame = new_frame(full)
+
+    def run():
+        frame.draw()
+
+    return 1000 * best_time(run, 50, repeat)
+
+
+def bench_animation(repeat):
+    """Milliseconds per frame of stepping the animations of the board
+    intro and a row of falling tokens, on a 45 fps clock"""
+    best = None
+    for _ in range(repeat):
+        timeline.__init__()
+        start = timeline.now
+        frame = Frame(None, (WIDTH / 2, HEIGHT / 2))
+        for col in range(g.GRID_COLS):
+            frame.add_token(g.GRID_ROWS - 1, col, 1 if col % 2 else -1)
+
+        ticks = 0
+        elapsed = 0.0
+        while timeline.running:
+            ticks += 1
+            now = start + ticks * 1000 // 45
+            before = time.perf_counter()
+            timeline.tick(now)
+            elapsed += time.perf_counter() - before
+        per_frame = 1000 * elapsed / ticks
+        best = per_frame if best is None else min(best, per_frame)
+    return best
+
+
+def run_main(frames, full):
+    """Drive Main for some frames after its intro, return the times of
+    its draw() calls in ms.
+
+    If full, every cell is filled and the whole window is redrawn in
+    every frame.
+    """
+    import main
+
+    timeline.__init__()  # pygame's clock starts over after pg.quit()
+    game = main.Main(journal=False)
+    times = []
+    draw = game.draw
+
+    def check_events():
+        if timeline.running:
+            del times[:]  # Leave out the intro
+        elif full and game.frame.moves[0][0] is None:
+            fill(game.frame)
+            del times[:]
+        elif len(times) >= frames:
+            game.running = False
+        elif full:
+            game.invalidate()
+
+    def timed_draw():
+        start = time.perf_counter()
+        result = draw()
+        times.append(1000 * (time.perf_counter() - start))
+        return result
+
+    game.check_events = check_events
+    game.draw = timed_draw
+    game.wait_for_input = lambda: None
+    fps = g.FPS
+    g.FPS = 0  # Don't wait between frames
+    try:
+        game.run()
+    except SystemExit:
+        pass
+    finally:
+        g.FPS = fps
+    return times
+
+
+def bench_main_draw(repeat, full):
+    times = run_main(50 * repeat, full)
+    return min(sum(times[i:i + 50]) / 50
+               for i in range(0, len(times) - 49, 50))
+
+
+def bench_startup(repeat):
+    """Milliseconds from starting Python until the first frame is drawn"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, os.path.abspath(__file__),
+                        "--startup-child"], check=True)
+        elapsed = 1000 * (time.perf_counter() - start)
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def startup_child():
+    pg.init()
+    pg.display.set_mode((WIDTH, HEIGHT))
+    import main
+
+    game = main.Main(journal=False)
+    draw = game.draw
+
+    def first_draw():
+        game.running = False
+        return draw()
+
+    game.draw = first_draw
+    game.wait_for_input = lambda: None
+    game.run()
+
+
+def has_gtk():
+    try:
+        import gi
+        gi.require_version("Gtk", "3.0")
+        from gi.repository import Gtk  # noqa: F401
+    except (ImportError, ValueError):
+        return False
+    return True
+
+
+BENCHMARKS = [
+    ("win_checks", RATE, bench_win_checks, False),
+    ("move_generation", RATE, bench_move_generation, False),
+    ("playouts", RATE, bench_playouts, False),
+    ("search_nodes", RATE, bench_search, False),
+    ("animation_tick", TIME, bench_animation, False),
+    ("frame_draw_empty", TIME, lambda r: bench_frame_draw(r, False), False),
+    ("frame_draw_full", TIME, lambda r: bench_frame_draw(r, True), False),
+    ("main_draw_idle", TIME, lambda r: bench_main_draw(r, False), True),
+    ("main_draw_full", TIME, lambda r: bench_main_draw(r, True), True),
+    ("startup", TIME, bench_startup, True),
+]
+
+
+def run(names=None, repeat=5, log=None):
+    pg.init()
+    pg.display.set_mode((WIDTH, HEIGHT))
+    g.init()
+    gtk = has_gtk()
+
+    results = {}
+    for name, (unit, higher), fn, needs_gtk in BENCHMARKS:
+        if names and name not in names:
+            continue
+        if needs_gtk and not gtk:
+            results[name] = {"skipped": "needs GTK"}
+        else:
+            # Main.run() shuts pygame down, bring it back for the others
+            if not pg.display.get_init():
+                pg.init()
+                pg.display.set_mode((WIDTH, HEIGHT))
+                g.init()
+            results[name] = {"value": fn(repeat), "unit": unit,
+                             "higher_is_better": higher}
+        if log is not None:
+            log(format_result(name, results[name]))
+
+    return {
+        "python": platform.python_version(),
+        "pygame": pg.version.ver,
+        "machine": platform.machine(),
+        "results": results,
+    }
+
+
+def format_result(name, result, baseline=None):
+    if "skipped" in result:
+        return "%-18s skipped, %s" % (name, result["skipped"])
+    line = "%-18s %12.4f %s" % (name, result["value"], result["unit"])
+    if baseline is not None and "value" in baseline:
+        change = 100 * (result["value"] / baseline["value"] - 1)
+        better = (change > 0) == result["higher_is_better"]
+        line += "  %+7.1f%% %s" % (change, "better" if better else "worse")
+    return line
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the benchmarks")
+    parser.add_argument("-o", "--output", help="write the results here")
+    parser.add_argument("--baseline", help="compare with earlier results")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--only", nargs="*", metavar="NAME",
+                        choices=[name for name, _, _, _ in BENCHMARKS])
+    parser.add_argument("--startup-child", action="store_true",
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.startup_child:
+        startup_child()
+        return
+
+    def log(message):
+        print(message, file=sys.stderr)
+
+    report = run(args.only, args.repeat, None if args.baseline else log)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        for name, result in report["results"].items():
+            log(format_result(name, result, baseline.get(name)))
+        report["baseline"] = args.baseline
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    else:
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
+        print()
+
+
+if __name__ == "__main__":
+    main()
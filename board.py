@@ -0,0 +1,126 @@
+# board.py
+
+"""Bitboard representation of the Connect Four grid.
+
+Every player's tokens are kept in one integer mask. The grid is stored
+column after column, bottom cell first, with one spare bit on top of
+each column so that shifting a mask never carries a token from one
+column into the next one.
+
+Rows are numbered top-down (row 0 is the top of the board) to match the
+way Frame lays the grid out on screen.
+
+The board is not limited to Connect Four: any size works and `connect`
+sets how many tokens in a row win. A plain grid of cells is kept next
+to the masks, so the win check after a move only looks at the runs
+through the cell that was just played and costs the same on a 100x100
+board as on the standard one.
+"""
+
+
+class Board:
+    def __init__(self, rows, cols, connect=4):
+        self.rows = rows
+        self.cols = cols
+        self.connect = connect  # Tokens in a row that win
+        self.height = rows + 1  # One spare bit per column
+
+        # Shifts for the four directions: vertical, horizontal and the
+        # two diagonals.
+        self.directions = (1, self.height, self.height - 1, self.height + 1)
+
+        self.reset()
+
+    def reset(self):
+        self.masks = [0, 0]  # masks[0] for player 1, masks[1] for player -1
+        self.heights = [0] * self.cols
+        self.cells = [[0] * self.cols for _ in range(self.rows)]
+        self.count = 0
+
+    @staticmethod
+    def index(player):
+        return 0 if player == 1 else 1
+
+    def bit(self, row, col):
+        return 1 << (col * self.height + self.rows - 1 - row)
+
+    def cell(self, bit_index):
+        """Convert a bit index back into a (row, col) pair"""
+        col, r = divmod(bit_index, self.height)
+        return self.rows - 1 - r, col
+
+    def get(self, row, col):
+        return self.cells[row][col]
+
+    def can_play(self, col):
+        return 0 <= col < self.cols and self.heights[col] < self.rows
+
+    def next_open_row(self, col):
+        """Lowest empty row of a column or None when the column is full"""
+        if not self.can_play(col):
+            return None
+        return self.rows - 1 - self.heights[col]
+
+    def play(self, col, player):
+        """Drop a token for player into col and return the row it lands in"""
+        row = self.next_open_row(col)
+        if row is None:
+            return None
+        self.masks[self.index(player)] |= self.bit(row, col)
+        self.cells[row][col] = player
+        self.heights[col] += 1
+        self.count += 1
+        return row
+
+    def undo(self, col):
+        """Take the top token back out of col"""
+        self.heights[col] -= 1
+        self.count -= 1
+        bit = 1 << (col * self.height + self.heights[col])
+        self.masks[0] &= ~bit
+        self.masks[1] &= ~bit
+        self.cells[self.rows - 1 - self.heights[col]][col] = 0
+
+    def is_full(self):
+        return self.count == self.rows * self.cols
+
+    def has_line(self, mask):
+        """Check a mask for `connect` in a row with shift-and-AND steps"""
+        for shift in self.directions:
+            m = mask
+            for _ in range(self.connect - 1):
+                m &= m >> shift
+            if m:
+                return True
+        return False
+
+    def is_win(self, player):
+        return self.has_line(self.masks[self.index(player)])
+
+    def winning_line(self, row, col):
+        """Return the cells of a winning line through (row, col), if any.
+
+        The runs of the same player are counted outwards from the cell
+        along the four directions, so only cells near it are looked at.
+        """
+        player = self.cells[row][col]
+        if player == 0:
+            return None
+
+        for dr, dc in ((1, 0), (0, 1), (1, 1), (1, -1)):
+            line = [(row, col)]
+            for sign in (-1, 1):
+                r = row + sign * dr
+                c = col + sign * dc
+                while (0 <= r < self.rows and 0 <= c < self.cols and
+                       self.cells[r][c] == player):
+                    line.append((r, c))
+                    r += sign * dr
+                    c += sign * dc
+            if len(line) >= self.connect:
+                return sorted(line)
+        return None
+
+    def grid(self):
+        """The board as a list of rows (0 = empty, 1 and -1 = players)"""
+        return [list(row) for row in self.cells]
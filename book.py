@@ -0,0 +1,208 @@
+# book.py
+
+"""Opening book for the computer opponent.
+
+The book is a sorted table of (position key, score) records. Keys are
+folded over the mirror symmetry of the board, so a position and its
+mirror image share one record. The file is memory-mapped and searched
+with a binary search, so opening a book costs next to nothing and only
+the pages that are actually touched get read.
+
+Generate a book with:
+
+    python3 book.py --plies 6 --depth 6 -o book.bin
+"""
+
+import argparse
+import mmap
+import os
+import struct
+import sys
+import time
+
+import ai
+
+MAGIC = b"C4BK"
+VERSION = 1
+
+# magic, version, rows, cols, plies, search depth, record count
+HEADER = struct.Struct("<4sBBBBBxxxI")
+# position key, score for the side to move
+RECORD = struct.Struct("<Qi")
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            "book.bin")
+
+
+class Layout:
+    """Key arithmetic shared by the generator and the reader"""
+
+    def __init__(self, rows, cols):
+        if cols * (rows + 1) > 64:
+            raise ValueError("Board too large for 64 bit book keys")
+        self.rows = rows
+        self.cols = cols
+        self.height = rows + 1
+        self.bottom = sum(1 << (col * self.height) for col in range(cols))
+        self.column = (1 << self.height) - 1
+
+    def mirror(self, key):
+        result = 0
+        for col in range(self.cols):
+            bits = (key >> (col * self.height)) & self.column
+            result |= bits << ((self.cols - 1 - col) * self.height)
+        return result
+
+    def key(self, position, mask):
+        """Unique key of a position, the same for its mirror image"""
+        key = position + mask + self.bottom
+        return min(key, self.mirror(key))
+
+
+class OpeningBook:
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        self.file = open(path, "rb")
+        try:
+            self.map = mmap.mmap(self.file.fileno(), 0,
+                                 access=mmap.ACCESS_READ)
+        except ValueError:
+            self.file.close()
+            raise ValueError("Empty opening book %s" % path)
+
+        (magic, version, rows, cols, self.plies, self.depth,
+         self.count) = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError("Not an opening book: %s" % path)
+        self.rows = rows
+        self.cols = cols
+        self.layout = Layout(rows, cols)
+
+    @classmethod
+    def load(cls, path=DEFAULT_PATH):
+        """Open the book at path, or return None if there is none"""
+        if not os.path.exists(path):
+            return None
+        return cls(path)
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+    def get(self, key):
+        """Score of the position with the given key, or None"""
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            mid_key, score = RECORD.unpack_from(
+                self.map, HEADER.size + mid * RECORD.size)
+            if mid_key < key:
+                lo = mid + 1
+            elif mid_key > key:
+                hi = mid
+            else:
+                return score
+        return None
+
+    def best_move(self, engine, position, mask):
+        """Best column according to the book, or None if not covered"""
+        # Books are only generated for connect four
+        if (engine.rows, engine.cols, engine.connect) != (self.rows,
+                                                          self.cols, 4):
+            return None
+
+        possible = (mask + engine.bottom) & engine.board_mask
+        best_col = None
+        best_score = None
+        for col in engine.order:
+            move = possible & engine.column_masks[col]
+            if not move:
+                continue
+            score = self.get(self.layout.key(position ^ mask, mask | move))
+            if score is None:
+                return None
+            if best_score is None or -score > best_score:
+                best_score = -score
+                best_col = col
+        return best_col
+
+
+def generate(path, rows, cols, plies, depth, log=None):
+    """Score every position with at most `plies` tokens and write a book.
+
+    Positions at the last ply are searched `depth` plies deep, the ones
+    before are scored from their children, so the book root is as good
+    as a search of plies + depth moves.
+    """
+    layout = Layout(rows, cols)
+    engine = ai.Engine(rows, cols)
+
+    # Every distinct position per ply, keyed by its canonical key
+    levels = [{layout.key(0, 0): (0, 0)}]
+    for ply in range(plies):
+        children = {}
+        for position, mask in levels[-1].values():
+            possible = (mask + engine.bottom) & engine.board_mask
+            # Positions with a winning move get their score directly
+            if engine.winning_cells(position, mask) & possible:
+                continue
+            for col in range(cols):
+                move = possible & engine.column_masks[col]
+                if move:
+                    child = (position ^ mask, mask | move)
+                    children.setdefault(layout.key(*child), child)
+        levels.append(children)
+
+    scores = {}
+    for ply in range(plies, -1, -1):
+        start = time.time()
+        for key, (position, mask) in levels[ply].items():
+            possible = (mask + engine.bottom) & engine.board_mask
+            if engine.winning_cells(position, mask) & possible:
+                scores[key] = ai.WIN_SCORE - ply - 1
+            elif ply == plies or not possible:
+                side = ply & 1
+                zobrist = engine.position_key(position, mask, side)
+                scores[key] = engine.negamax(
+                    position, mask, ply, zobrist, side, depth,
+                    -ai.WIN_SCORE - 1, ai.WIN_SCORE + 1)
+            else:
+                scores[key] = max(
+                    -scores[layout.key(position ^ mask, mask | move)]
+                    for move in (possible & m for m in engine.column_masks)
+                    if move
+                )
+        if log is not None:
+            log("ply %d: %d positions in %.1f s" %
+                (ply, len(levels[ply]), time.time() - start))
+
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, rows, cols, plies, depth,
+                            len(scores)))
+        for key in sorted(scores):
+            f.write(RECORD.pack(key, scores[key]))
+    return len(scores)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build an opening book")
+    parser.add_argument("-o", "--output", default=DEFAULT_PATH)
+    parser.add_argument("--rows", type=int, default=6)
+    parser.add_argument("--cols", type=int, default=7)
+    parser.add_argument("--plies", type=int, default=6,
+                        help="book every position up to this many tokens")
+    parser.add_argument("--depth", type=int, default=6,
+                        help="search depth below the last ply")
+    args = parser.parse_args(argv)
+
+    def log(message):
+        print(message, file=sys.stderr)
+
+    count = generate(args.output, args.rows, args.cols, args.plies,
+                     args.depth, log)
+    log("%d positions written to %s" % (count, args.output))
+
+
+if __name__ == "__main__":
+    main()
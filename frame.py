@@ -1,18 +1,88 @@
 # frame.py modifications
 
 import pygame as pg
-from anim import Animate
+from anim import Animate, draw_token, timeline
+from game import Game
 import g
 
+# The finished board, see board_surface()
+_board_cache = {}
+
+
+def board_surface(gap, rows, cols):
+    """Board background, grid and holes drawn once into one surface.
+
+    The holes are punched out with a colorkey, so tokens drawn before
+    the board show through them. The surface is rebuilt only when the
+    board geometry changes.
+    """
+    key = (gap, rows, cols, g.CIRCLE_RADIUS, g.LINE_WIDTH)
+    surface = _board_cache.get(key)
+    if surface is not None:
+        return surface
+
+    # Lines are centered on the board edges, so leave room for them
+    margin = g.LINE_WIDTH
+    width = cols * gap
+    height = rows * gap
+    surface = pg.Surface((width + 2 * margin, height + 2 * margin))
+    surface.fill(g.HOLE_COLOR)
+    pg.draw.rect(surface, g.BLUE, (margin, margin, width, height))
+
+    lines = [
+        ((margin, margin), (margin + width, margin)),
+        ((margin + width, margin), (margin + width, margin + height)),
+        ((margin + width, margin + height), (margin, margin + height)),
+        ((margin, margin + height), (margin, margin)),
+    ]
+    for i in range(1, cols):
+        x = margin + i * gap
+        lines.append(((x, margin), (x, margin + height)))
+    for i in range(1, rows):
+        y = margin + i * gap
+        lines.append(((margin, y), (margin + width, y)))
+    for start, end in lines:
+        pg.draw.line(surface, g.WHITE, start, end, g.LINE_WIDTH)
+
+    for row in range(rows):
+        for col in range(cols):
+            x = margin + (col + 0.5) * gap
+            y = margin + (row + 0.5) * gap
+            pg.draw.circle(surface, g.HOLE_COLOR, (int(x), int(y)),
+                           g.CIRCLE_RADIUS)
+
+    surface.set_colorkey(g.HOLE_COLOR)
+    if pg.display.get_surface() is not None:
+        surface = surface.convert()
+    _board_cache.clear()
+    _board_cache[key] = surface
+    return surface
+
 
 class Frame:
-    def __init__(self, main, center, gap=g.FRAME_GAP):
+    def __init__(self, main, center, gap=None):
+        if gap is None:
+            gap = g.FRAME_GAP  # Scaled to the window by g.init()
         self.main = main
-        self.gap = gap
-        self.turn = 1  # 1 for Player 1 (Orange), -1 for Player 2 (Red)
+        self.game = Game(g.GRID_ROWS, g.GRID_COLS, g.CONNECT)
         self.remove = False
+
+        # Tokens on screen, the game state itself lives in self.game
+        self.moves = [[None for _ in range(g.GRID_COLS)] for _ in range(g.GRID_ROWS)]
+
+        # Visual feedback for hover
+        self.hover_col = -1
+        self.drawn_hover = -1
+
+        self.blinking = []  # Tokens of the winning line
+        self.intro_done = False
+        self.place(center, gap)
+
+    def place(self, center, gap):
+        """Work out where the board and its lines go on screen"""
         self.center = center
-        
+        self.gap = gap
+
         # Calculate board dimensions
         self.board_width = g.GRID_COLS * gap
         self.board_height = g.GRID_ROWS * gap
@@ -44,73 +114,182 @@ class Frame:
             y = top + i * gap
             self.grid_lines.append(([left, y], [right, y]))
             
-        # Initialize the game board (0 = empty, 1 = player 1, -1 = player 2)
-        self.board = [[0 for _ in range(g.GRID_COLS)] for _ in range(g.GRID_ROWS)]
-        self.moves = [[None for _ in range(g.GRID_COLS)] for _ in range(g.GRID_ROWS)]
-        
-        # Create column rects for click detection (only need tops of columns)
-        self.column_rects = []
-        for col in range(g.GRID_COLS):
-            x = left + col * gap
-            self.column_rects.append(pg.Rect(x, top - gap, gap, gap))
-            
-        # Visual feedback for hover
-        self.hover_col = -1
+        # Columns are found from the pointer position by arithmetic, a
+        # click anywhere from the strip above the board down to its
+        # bottom picks the column under it.
+        self.left = left
+        self.top = top
+
+        # Areas to redraw in the next frame, see dirty_rects()
+        self.dirty = [self.rect().inflate(gap, 2 * gap)]
         
         # Initialize animations for board outline
         self.animations = [
-            Animate(main, 500 + i * 100).line(self.points[i], 
-                                            self.points[(i + 1) % len(self.points)])
+            Animate(self.main, 500 + i * 100).line(self.points[i], 
+                                                 self.points[(i + 1) % len(self.points)])
             for i in range(len(self.points))
         ]
         
         # Add animations for grid lines
         for line in self.grid_lines:
-            self.animations.append(Animate(main, 800).line(line[0], line[1]))
-
-    def detect_click(self, pos):
-        for col, rect in enumerate(self.column_rects):
-            if rect.collidepoint(pos):
-                # Find the lowest empty row in this column
-                row = self.get_next_open_row(col)
-                if row is not None:  # Column not full
-                    # Update the board
-                    self.board[row][col] = self.turn
-                    
-                    # Calculate token position
-                    token_x = rect.centerx
-                    token_y = self.center[1] - self.board_height/2 + (row + 0.5) * self.gap
-                    
-                    # Create token animation
-                    self.moves[row][col] = Token(self.main, 
-                                               self.turn,
-                                               (token_x, token_y),
-                                               row)
-                    
-                    # Check for win
-                    if self.check_win(row, col):
-                        self.main.score[0 if self.turn == 1 else 1] += 1
-                        self.reset()
-                    # Switch turns
-                    self.turn *= -1
-                    self.main.set_turn()
-                    return True
-        return False
-    
+            self.animations.append(Animate(self.main, 800).line(line[0], line[1]))
+
+    def resize(self, center, gap):
+        """Move the board after the window was resized.
+
+        The game goes on, the board is drawn at its new place and size
+        straight away, without the intro.
+        """
+        self.place(center, gap)
+        for animation in self.animations:
+            animation.step(timeline.now, skip=True)
+        self.blinking = []
+        board = self.board
+        for row in range(board.rows):
+            for col in range(board.cols):
+                self.moves[row][col] = None
+                player = board.get(row, col)
+                if player:
+                    self.add_token(row, col, player, False)
+
+    def rect(self):
+        return pg.Rect(
+            self.center[0] - self.board_width/2,
+            self.center[1] - self.board_height/2,
+            self.board_width,
+            self.board_height
+        )
+
+    def hover_rect(self, col):
+        x = self.column_x(col)
+        y = self.top - self.gap / 2
+        r = g.CIRCLE_RADIUS
+        return pg.Rect(int(x) - r - 1, int(y) - r - 1, 2 * r + 3, 2 * r + 3)
+
+    def visible_cells(self):
+        """Ranges of the rows and columns inside the clip rect.
+
+        Drawing only these keeps the cost of a frame down to the part
+        of the window being redrawn, even on very large boards.
+        """
+        clip = g.WIN.get_clip().clip(self.rect())
+        if not clip:
+            return range(0), range(0)
+        first_row = int((clip.top - self.top) // self.gap)
+        last_row = int((clip.bottom - 1 - self.top) // self.gap)
+        first_col = int((clip.left - self.left) // self.gap)
+        last_col = int((clip.right - 1 - self.left) // self.gap)
+        return (range(max(0, first_row), min(g.GRID_ROWS, last_row + 1)),
+                range(max(0, first_col), min(g.GRID_COLS, last_col + 1)))
+
+    def dirty_rects(self):
+        """Areas of the board that change in the next frame.
+
+        Running animations are reported by the timeline, this only adds
+        the blinking tokens, the hover slot and cleared boards.
+        """
+        dirty = self.dirty
+        self.dirty = []
+        if self.blinking:
+            self.blinking = [token for token in self.blinking
+                             if token.active()]
+            dirty.extend(token.extent() for token in self.blinking)
+        if self.remove:
+            # Keep drawing until the board is taken away
+            dirty.append(self.rect())
+        if self.hover_col != self.drawn_hover:
+            for col in (self.drawn_hover, self.hover_col):
+                if col >= 0:
+                    dirty.append(self.hover_rect(col))
+            self.drawn_hover = self.hover_col
+        return dirty
+
+    @property
+    def board(self):
+        return self.game.board
+
+    @property
+    def turn(self):
+        return self.game.turn
+
+    def column_at(self, pos):
+        """Return the column under pos, or None"""
+        x, y = pos
+        if not self.top - self.gap <= y < self.top + self.board_height:
+            return None
+        col = int((x - self.left) // self.gap)
+        return col if 0 <= col < g.GRID_COLS else None
+
+    def column_x(self, col):
+        """Horizontal center of a column"""
+        return self.left + (col + 0.5) * self.gap
+
+    def drop(self, col):
+        """Drop a token for the current player into col"""
+        player = self.turn
+        row = self.game.play(col)
+        if row is None:  # Column is full or the game is over
+            return False
+
+        self.add_token(row, col, player)
+
+        if self.game.winner:
+            self.highlight_win(self.game.line)
+        return True
+
+    def add_token(self, row, col, player, animate=True):
+        # Calculate token position
+        token_x = self.column_x(col)
+        token_y = self.center[1] - self.board_height/2 + (row + 0.5) * self.gap
+
+        # Create token animation
+        self.moves[row][col] = Token(self.main,
+                                     player,
+                                     (token_x, token_y),
+                                     row,
+                                     animate)
+
+    def load(self, first, moves):
+        """Start a game from a list of moves, without any animation.
+
+        The moves are replayed on the game alone and the tokens are put
+        on the board afterwards in one pass.
+        """
+        game = self.game
+        game.turn = first
+        game.new_game()
+        for col in moves:
+            if game.play(col) is None:
+                break
+        if game.is_over():
+            # Finished games are never saved, start a new one
+            game.new_game()
+
+        board = game.board
+        self.blinking = []
+        for row in range(board.rows):
+            for col in range(board.cols):
+                player = board.get(row, col)
+                self.moves[row][col] = None
+                if player:
+                    self.add_token(row, col, player, False)
+        self.dirty.append(self.rect())
+
     def get_next_open_row(self, col):
         """Find the lowest empty row in the given column"""
-        for row in range(g.GRID_ROWS - 1, -1, -1):
-            if self.board[row][col] == 0:
-                return row
-        return None  # Column is full
+        return self.board.next_open_row(col)  # None if the column is full
     
     def update_hover(self, pos):
-        """Update hover effect for columns"""
-        self.hover_col = -1
-        for col, rect in enumerate(self.column_rects):
-            if rect.collidepoint(pos) and self.get_next_open_row(col) is not None:
-                self.hover_col = col
-                break
+        """Move the hover effect to the column under pos.
+
+        Returns True if the hovered column changed.
+        """
+        col = self.column_at(pos)
+        if col is None or not self.board.can_play(col):
+            col = -1
+        changed = col != self.hover_col
+        self.hover_col = col
+        return changed
     
     def reset(self, wait=True):
         for row in range(g.GRID_ROWS):
@@ -118,7 +297,7 @@ class Frame:
                 if self.moves[row][col] is not None:
                     self.moves[row][col].wait_and_remove = True
                     if wait:
-                        ticks = pg.time.get_ticks()
+                        ticks = timeline.now
                         self.moves[row][col].remove_time = (
                             2 * self.moves[row][col].blink_count * 
                             self.moves[row][col].blink_dur + ticks
@@ -127,113 +306,84 @@ class Frame:
                         self.moves[row][col].remove_time = 0
                         
         # Clear board after animation
-        self.board = [[0 for _ in range(g.GRID_COLS)] for _ in range(g.GRID_ROWS)]
+        self.game.new_game()
+        self.dirty.append(self.rect())
         self.moves = [[None for _ in range(g.GRID_COLS)] for _ in range(g.GRID_ROWS)]
+        # The old tokens are no longer drawn, so they never stop blinking
+        self.blinking = []
 
-    def check_win(self, row, col):
-        """Check for 4 in a row starting from the last move"""
-        player = self.board[row][col]
-        
-        # Check horizontal
-        for c in range(max(0, col - 3), min(col + 1, g.GRID_COLS - 3)):
-            if (self.board[row][c] == player and 
-                self.board[row][c+1] == player and 
-                self.board[row][c+2] == player and 
-                self.board[row][c+3] == player):
-                self.highlight_win([(row, c), (row, c+1), (row, c+2), (row, c+3)])
-                return True
-                
-        # Check vertical
-        if row <= g.GRID_ROWS - 4:
-            if (self.board[row][col] == player and 
-                self.board[row+1][col] == player and 
-                self.board[row+2][col] == player and 
-                self.board[row+3][col] == player):
-                self.highlight_win([(row, col), (row+1, col), (row+2, col), (row+3, col)])
-                return True
-                
-        # Check diagonal (positive slope)
-        for r, c in [(row + i, col - i) for i in range(4)]:
-            if (0 <= r + 3 < g.GRID_ROWS and 0 <= c + 3 < g.GRID_COLS and
-                self.board[r][c] == player and 
-                self.board[r+1][c+1] == player and 
-                self.board[r+2][c+2] == player and 
-                self.board[r+3][c+3] == player):
-                self.highlight_win([(r, c), (r+1, c+1), (r+2, c+2), (r+3, c+3)])
-                return True
-                
-        # Check diagonal (negative slope)
-        for r, c in [(row - i, col - i) for i in range(4)]:
-            if (0 <= r < g.GRID_ROWS - 3 and 0 <= c < g.GRID_COLS - 3 and
-                self.board[r][c] == player and 
-                self.board[r+1][c+1] == player and 
-                self.board[r+2][c+2] == player and 
-                self.board[r+3][c+3] == player):
-                self.highlight_win([(r, c), (r+1, c+1), (r+2, c+2), (r+3, c+3)])
-                return True
-        
-        # Check for tie (full board)
-        is_full = all(self.board[0][c] != 0 for c in range(g.GRID_COLS))
-        if is_full:
-            self.reset()
-            return False
-            
-        return False
-    
     def highlight_win(self, positions):
         """Highlight the winning tokens"""
         for row, col in positions:
             if self.moves[row][col] is not None:
                 self.moves[row][col].blink = True
-                self.moves[row][col].blink_start = pg.time.get_ticks()
+                self.moves[row][col].blink_start = timeline.now
+                self.blinking.append(self.moves[row][col])
 
     def setup_remove(self, dur=500, animate=False):
         if not self.remove:
             self.remove = True
-            self.remove_time = pg.time.get_ticks() + dur
+            self.remove_time = timeline.now + dur
             if animate:
+                self.intro_done = False
                 for i in self.animations:
                     i.setup_remove(dur)
 
     def draw(self):
+        if not self.intro_done:
+            self.intro_done = not any(animation.active()
+                                      for animation in self.animations)
+        if not self.intro_done:
+            self.draw_animated()
+        else:
+            # Tokens first, then the pre-rendered board with holes on top
+            rows, cols = self.visible_cells()
+            for row in rows:
+                for col in cols:
+                    token = self.moves[row][col]
+                    if token is not None:
+                        token.draw()
+            rect = self.rect()
+            g.WIN.blit(
+                board_surface(self.gap, g.GRID_ROWS, g.GRID_COLS),
+                (rect.x - g.LINE_WIDTH, rect.y - g.LINE_WIDTH)
+            )
+
+        # Draw hover effect
+        if self.hover_col >= 0:
+            x = self.column_x(self.hover_col)
+            y = self.top - self.gap / 2
+            color = g.ORANGE if self.turn == 1 else g.RED
+            draw_token(color, (x, y))
+
+        if self.remove:
+            if timeline.now > self.remove_time:
+                self.main.reset()
+
+    def draw_animated(self):
+        """Draw the board piece by piece while its lines are animating"""
         # Draw board background
-        board_rect = pg.Rect(
-            self.center[0] - self.board_width/2,
-            self.center[1] - self.board_height/2,
-            self.board_width,
-            self.board_height
-        )
-        pg.draw.rect(g.WIN, g.BLUE, board_rect)
+        pg.draw.rect(g.WIN, g.BLUE, self.rect())
         
         # Draw board outline and grid
         for animation in self.animations:
-            animation.update()
+            animation.draw()
             
         # Draw tokens
-        for row in range(g.GRID_ROWS):
-            for col in range(g.GRID_COLS):
+        rows, cols = self.visible_cells()
+        for row in rows:
+            for col in cols:
                 if self.moves[row][col] is not None:
                     self.moves[row][col].draw()
                 else:
                     # Draw empty slots
-                    x = self.center[0] - self.board_width/2 + (col + 0.5) * self.gap
-                    y = self.center[1] - self.board_height/2 + (row + 0.5) * self.gap
-                    pg.draw.circle(g.WIN, g.BLACK, (int(x), int(y)), g.CIRCLE_RADIUS)
-        
-        # Draw hover effect
-        if self.hover_col >= 0:
-            x = self.center[0] - self.board_width/2 + (self.hover_col + 0.5) * self.gap
-            y = self.center[1] - self.board_height/2 - self.gap/2
-            color = g.ORANGE if self.turn == 1 else g.RED
-            pg.draw.circle(g.WIN, color, (int(x), int(y)), g.CIRCLE_RADIUS)
-            
-        if self.remove:
-            if pg.time.get_ticks() > self.remove_time:
-                self.main.reset()
+                    x = self.column_x(col)
+                    y = self.top + (row + 0.5) * self.gap
+                    draw_token(g.BLACK, (x, y))
 
 
 class Token:
-    def __init__(self, main, _type, center, row):
+    def __init__(self, main, _type, center, row, animate=True):
         self.main = main
         self.type = _type
         self.center = center
@@ -248,21 +398,30 @@ class Token:
         # Create token animation
         color = g.ORANGE if _type == 1 else g.RED
         self.animation = Animate(main, color=color).circle(center)
+        if not animate:
+            self.animation.step(timeline.now, skip=True)
+
+    def active(self):
+        """True while the token's own timers run"""
+        return self.blink or self.wait_and_remove
+
+    def extent(self):
+        return self.animation.extent()
 
     def draw(self):
         if self.blink:
-            if pg.time.get_ticks() < self.blink_start + self.blink_dur:
-                self.animation.update()
-            elif pg.time.get_ticks() > self.blink_start + 2 * self.blink_dur:
-                self.blink_start = pg.time.get_ticks()
+            if timeline.now < self.blink_start + self.blink_dur:
+                self.animation.draw()
+            elif timeline.now > self.blink_start + 2 * self.blink_dur:
+                self.blink_start = timeline.now
                 self.blink_count -= 1
                 if self.blink_count == 0:
                     self.blink = False
         else:
-            self.animation.update()
+            self.animation.draw()
 
         if self.wait_and_remove:
-            if pg.time.get_ticks() > self.remove_time:
+            if timeline.now > self.remove_time:
                 self.animation.setup_remove()
                 self.main.frame.setup_remove()
                 self.wait_and_remove = False
\ No newline at end of file
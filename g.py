@@ -11,20 +11,48 @@ GREY = pg.Color("#333333")
 ORANGE = pg.Color("#FF6600")  # Player 1 color
 RED = pg.Color("#FF1F00")     # Player 2 color
 BLUE = pg.Color("#3333AA")    # Board color
-FRAME_GAP = 80                # Smaller gap for the larger board
+HOLE_COLOR = pg.Color("#FF00FF")  # Colorkey of the holes in the board
+BOARD_GAP = 80                # Cell size on boards that fit the window
+FRAME_GAP = BOARD_GAP         # Cell size in use, see scale_board()
 LINE_WIDTH = 5                # Thinner lines
 CIRCLE_RADIUS = 30            # Smaller tokens
 CIRCLE_WIDTH = 0              # Filled circles, not outlines
+TOKEN_SUPERSAMPLE = 4         # Smooth token edges, 1 for hard edges
 CROSS_WIDTH = 14              # Not used but kept for compatibility
 CROSS_LENGTH = 54             # Not used but kept for compatibility
 GRID_ROWS = 6                 # Connect Four is 6 rows
 GRID_COLS = 7                 # Connect Four is 7 columns
+CONNECT = 4                   # Tokens in a row that win
+MIN_GAP = 6                   # Smallest cell size before culling
+SEARCH_WORKERS = 1            # Processes searching for the computer
+MOVE_TIME = 1.0               # Seconds the computer may think per move
+DEBUG_DIRTY = False           # Outline the redrawn parts of the window
+DIRTY_COLOR = pg.Color("#FF00FF")
+SHOW_TIMINGS = False          # Frame time overlay, F3 toggles it
+TIMINGS_SIZE = 600            # Frames kept for the frame time overlay
+TIMINGS_FILE = None           # Write the frame times here on quit
 
-def init():
+def init(reserve=0):
     global WIN, WIDTH, HEIGHT
     WIN = pg.display.get_surface()
     if WIN is None:
         WIN = pg.display.get_surface()
     if WIN is not None:
         WIDTH, HEIGHT = WIN.get_size()
-    WIDTH, HEIGHT = WIN.get_size()
\ No newline at end of file
+    WIDTH, HEIGHT = WIN.get_size()
+    scale_board(reserve)
+
+
+def scale_board(reserve=0):
+    """Shrink the cells of large boards so the board fits the window.
+
+    reserve is the height kept free above and below the board for the
+    buttons. Cells never get smaller than MIN_GAP, boards that still
+    don't fit are drawn partly and only their visible cells are drawn.
+    """
+    global FRAME_GAP, CIRCLE_RADIUS, LINE_WIDTH
+    height = min(int(HEIGHT * 0.7), HEIGHT - 2 * reserve)
+    fit = min(height // GRID_ROWS, int(WIDTH * 0.6) // GRID_COLS)
+    FRAME_GAP = max(MIN_GAP, min(BOARD_GAP, fit))
+    CIRCLE_RADIUS = FRAME_GAP * 3 // 8
+    LINE_WIDTH = max(1, FRAME_GAP // 16)
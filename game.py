@@ -0,0 +1,64 @@
+# game.py
+
+"""Connect Four rules without any rendering.
+
+Game keeps the board, whose turn it is and the moves played so far.
+It only depends on board.Board, so it can be imported and run without
+pygame, GTK or Sugar, e.g. for simulations, tests or the computer
+opponent.
+
+The board size and the number of tokens in a row that win are
+parameters, so larger connect-N games use the same rules.
+"""
+
+from board import Board
+
+
+class Game:
+    def __init__(self, rows, cols, connect=4):
+        self.board = Board(rows, cols, connect)
+        self.turn = 1  # 1 for Player 1 (Orange), -1 for Player 2 (Red)
+        self.new_game()
+
+    def new_game(self):
+        """Clear the board, the player to move keeps alternating"""
+        self.board.reset()
+        self.history = []  # Columns played, in order
+        self.winner = 0
+        self.line = None  # Cells of the winning line
+
+    def legal_moves(self):
+        if self.winner:
+            return []
+        return [col for col in range(self.board.cols)
+                if self.board.can_play(col)]
+
+    def play(self, col):
+        """Play col for the current player and return the row it lands in"""
+        if self.winner:
+            return None
+        row = self.board.play(col, self.turn)
+        if row is None:
+            return None
+        self.history.append(col)
+
+        self.line = self.board.winning_line(row, col)
+        if self.line is not None:
+            self.winner = self.turn
+        self.turn *= -1
+        return row
+
+    def unplay(self):
+        """Take back the last move"""
+        col = self.history.pop()
+        self.board.undo(col)
+        self.turn *= -1
+        self.winner = 0
+        self.line = None
+        return col
+
+    def is_draw(self):
+        return not self.winner and self.board.is_full()
+
+    def is_over(self):
+        return bool(self.winner) or self.board.is_full()
@@ -0,0 +1,78 @@
+# layout.py
+
+"""Where everything goes on screen.
+
+A Layout is worked out once for a window size, after g.init() has
+scaled the board to fit it, and is kept until the window is resized.
+Drawing and hit testing only look positions up, they never recompute
+them from the window size.
+"""
+
+import pygame as pg
+import g
+
+HELP_SPACING = 40     # Between the lines of the help panel
+HELP_PADDING = (50, 60)
+
+
+class Layout:
+    def __init__(self, width, height, gap, reset_size):
+        self.size = (width, height)
+        self.gap = gap
+        board_width = gap * g.GRID_COLS
+        board_height = gap * g.GRID_ROWS
+        self.board_center = (width / 2, height / 2)
+
+        # The turn text and the scores are centered in the margins on
+        # either side of the board
+        margin = (width - board_width) / 4
+        self.side_x = (margin, width - margin)
+        self.above_board = height * 0.5 - board_height / 2
+        self.score_y = height / 2 + g.BOARD_GAP / 4
+        self.markers = [(x, height / 2 - g.BOARD_GAP / 4)
+                        for x in self.side_x]
+
+        self.help_button = pg.Rect(
+            (3 * width + board_width) // 4 - 40,
+            self.above_board // 2 - 40,
+            80,
+            80,
+        )
+        reset_width, reset_height = reset_size
+        self.reset_rect = pg.Rect(
+            width / 2 - reset_width / 2,
+            height - reset_height - 80,
+            reset_width,
+            reset_height + 20,
+        )
+        self.reset_text_pos = (width / 2 - reset_width / 2,
+                               height - reset_height - 70)
+        self.help_panel = None  # Needs the help text, see help_rects()
+
+    def turn_pos(self, size):
+        """Top left corner of a turn text of the given size"""
+        return (self.side_x[0] - size[0] / 2,
+                (self.above_board - size[1]) // 2)
+
+    def score_pos(self, side, size):
+        """Top left corner of a score of the given size, side 0 or 1"""
+        return (self.side_x[side] - size[0] / 2, self.score_y)
+
+    def help_rects(self, sizes):
+        """The help panel and the position of every line in it"""
+        if self.help_panel is None:
+            width, height = self.size
+            pad_x, pad_y = HELP_PADDING
+            panel_width = max(w for w, _ in sizes) + 2 * pad_x
+            spacing = (len(sizes) - 1) * HELP_SPACING
+            panel_height = sum(h for _, h in sizes) + spacing + 2 * pad_y
+            panel = pg.Rect((width - panel_width) // 2,
+                            (height - panel_height) // 2,
+                            panel_width, panel_height)
+            lines = []
+            y = panel.y + pad_y
+            for w, h in sizes:
+                lines.append(((width - w) // 2, y))
+                y += h + HELP_SPACING
+            self.help_panel = (panel, lines)
+        return self.help_panel
@@ -1,7 +1,20 @@
+import time
+
+# When the game started loading, see Main.run()
+START_TIME = time.perf_counter()
+
 import pygame as pg
-from anim import Animate
+from ai import DEFAULT_LEVEL, LEVELS, Engine
+from book import OpeningBook
+from parallel import BackgroundSearch
+from record import GameRecord
+from text import TextCache
+from timing import FrameTimer
+from anim import Animate, timeline
 import g
 from frame import Frame
+from layout import Layout
+import logging
 import sys
 import gi
 
@@ -19,241 +32,429 @@ class Main:
         self.canvas = None
         self.score = [0, 0]
         self.show_help = False
-        self.help_pos = None
-        self.close_text = None
-        self.question_text = None
-        self.help_text = []
+        self.help_text = []  # Rendered when help is first shown
         self.turn_text = None
-        self.reset_rect = None
+        self.layout = None  # Positions on screen, see resize()
+        self.text = TextCache()
+        self.pending_events = []  # Events taken off the queue while idle
+        self.pointer = None  # Last mouse position, from MOUSEMOTION
+        self.timer = FrameTimer(g.TIMINGS_SIZE)
+        self.show_timings = g.SHOW_TIMINGS
+        self.timings_text = []  # Lines of the timing overlay
+        self.timings_rect = None
+        self.timings_time = 0  # When the overlay was last refreshed
+        self.idle_time = 0.0
+        self.startup_time = None  # Seconds until the first frame
+        self.run_start = None
+        self.computer = None  # Side the computer plays, None for 2 players
+        self.frame = None
+        self.saved = None  # GameRecord read before the game started
+        self.dirty = []  # Rects to redraw in the next frame
+        self.full_redraw = True
+        self.drawn_score = None
+        self.drawn_score_rects = []
+        self.drawn_turn_text = None
+        self.drawn_turn_rect = None
+        self.drawn_help = False
+        self.level = DEFAULT_LEVEL
+        self.search = None  # Set up when the computer first plays
 
     def set_canvas(self, canvas):
         self.canvas = canvas
         pg.display.set_caption(_("Connect Four"))
 
     def write_file(self, file_path):
-        pass
+        if self.frame is None:
+            # Not started yet, keep what was read
+            if self.saved is not None:
+                self.saved.save(file_path)
+            return
+        GameRecord.from_game(self.frame.game, self.score).save(file_path)
 
     def read_file(self, file_path):
-        pass
+        try:
+            self.saved = GameRecord.load(file_path)
+        except (OSError, ValueError) as e:
+            logging.warning("Can't resume from %s: %s", file_path, e)
+            return
+        if self.frame is not None:
+            self.restore()
+
+    def restore(self):
+        """Put the game read by read_file() on the board"""
+        record = self.saved
+        self.saved = None
+        if ((record.rows, record.cols, record.connect) !=
+                (g.GRID_ROWS, g.GRID_COLS, g.CONNECT)):
+            logging.warning("Saved game is for another board size")
+            return
+        self.score = record.score
+        self.frame.load(record.first, record.moves)
+        self.set_turn()
+        self.update_hover()
+        self.invalidate()
 
     def quit(self):
         self.running = False
 
+    def set_computer(self, enabled, side=-1):
+        self.computer = side if enabled else None
+
+    def set_level(self, level):
+        if level not in LEVELS:
+            raise ValueError("Unknown level %r" % level)
+        self.level = level
+        if self.search is not None:
+            self.search.set_level(level)
+
+    def background_search(self):
+        """The computer's search, set up the first time it plays"""
+        if self.search is None:
+            # The workers search with their shared table, this engine
+            # only tells them what to play, so it gets no table of its own
+            engine = Engine(g.GRID_ROWS, g.GRID_COLS, self.level,
+                            table_size=1, book=OpeningBook.load(),
+                            connect=g.CONNECT)
+            # The computer thinks in other processes so drawing never stops
+            self.search = BackgroundSearch(engine, g.SEARCH_WORKERS,
+                                           g.MOVE_TIME)
+        return self.search
+
+    def computer_turn(self):
+        return self.computer is not None and self.frame.turn == self.computer
+
+    def play_computer(self):
+        if not self.computer_turn():
+            return
+        board = self.frame.board
+        search = self.background_search()
+        if not search.busy():
+            search.start(board, self.frame.turn)
+        col = search.poll(board, self.frame.turn)
+        if col is not None:
+            self.drop(col)
+
+    def drop(self, col):
+        """Play col for the side to move and keep the score"""
+        if not self.frame.drop(col):
+            return False
+        game = self.frame.game
+        if game.winner:
+            self.score[game.board.index(game.winner)] += 1
+        if game.is_over():
+            self.frame.reset()
+        self.set_turn()
+        self.update_hover()
+        return True
+
+    def update_hover(self):
+        """Follow the pointer with the hover effect, True if it moved"""
+        if self.pointer is None:
+            return False
+        return self.frame.update_hover(self.pointer)
+
     def check_events(self):
-        mouse_pos = pg.mouse.get_pos()
-        self.frame.update_hover(mouse_pos)  # Update hover effect
-        
-        for event in pg.event.get():
+        # The hover effect only changes when the pointer moves
+        events = self.pending_events + pg.event.get()
+        self.pending_events = []
+        for event in events:
             if event.type == pg.QUIT:
                 self.running = False
             if event.type == pg.VIDEORESIZE:
                 pg.display.set_mode(event.size, pg.RESIZABLE)
+                self.resize()
                 break
+            if event.type == pg.VIDEOEXPOSE:
+                self.invalidate()
+            if event.type == pg.KEYDOWN and event.key == pg.K_F3:
+                self.show_timings = not self.show_timings
+                self.update_timings(True)
+            if event.type == pg.MOUSEMOTION:
+                self.pointer = event.pos
+                self.update_hover()
             if event.type == pg.MOUSEBUTTONUP:
-                if self.help_pos.collidepoint(mouse_pos):
+                mouse_pos = self.pointer = event.pos
+                if self.layout.help_button.collidepoint(mouse_pos):
                     self.show_help = not self.show_help
                 if self.show_help == True: 
                     break
                 if self.canvas is not None:
                     self.canvas.grab_focus()
-                if self.frame.detect_click(mouse_pos):
-                    self.set_turn()
-                if self.reset_rect.collidepoint(mouse_pos):
+                col = self.frame.column_at(mouse_pos)
+                if col is not None and not self.computer_turn():
+                    self.drop(col)
+                if self.layout.reset_rect.collidepoint(mouse_pos):
                     self.frame.reset(False)
                     self.score = [0, 0]
+                    self.update_hover()
+                    self.invalidate()
 
     def draw_help(self):
         if self.show_help:
-            
-            # Calculate the dimensions for help panel based on text content
-            max_text_width = max(text.get_width() for text in self.help_text)
-            total_text_height = sum(text.get_height() for text in self.help_text)
-            spacing = 40  # Space between lines
-            
-            # Calculate padding
-            horizontal_padding = 50
-            vertical_padding = 60
-            
-            # Calculate help panel dimensions
-            help_width = max_text_width + (horizontal_padding * 2)
-            help_height = total_text_height + ((len(self.help_text) - 1) * spacing) + (vertical_padding * 2)
-            
-            # Center the help panel
-            help_x = (g.WIDTH - help_width) // 2
-            help_y = (g.HEIGHT - help_height) // 2
-            
-            # Draw the help panel background
-            pg.draw.rect(
-                g.WIN,
-                g.GREY,
-                pg.Rect(
-                    help_x,
-                    help_y,
-                    help_width,
-                    help_height,
-                ),
-                border_radius=15  # Optional: rounded corners
-            )
-            
-            # Draw each line of help text
-            y_offset = help_y + vertical_padding
-            for text in self.help_text:
-                text_x = (g.WIDTH - text.get_width()) // 2
-                g.WIN.blit(text, (text_x, y_offset))
-                y_offset += text.get_height() + spacing
+            if not self.help_text:
+                self.help_text = [
+                    self.text.render(i, 36)
+                    for i in (
+                        _("Players take turns dropping colored tokens from the top."),
+                        _("The tokens fall to the lowest available space in the column."),
+                        _("The first player to get four tokens in a row (horizontally,"),
+                        _("vertically, or diagonally) wins the game!"),
+                    )
+                ]
+
+            panel, lines = self.layout.help_rects(
+                [text.get_size() for text in self.help_text])
+            pg.draw.rect(g.WIN, g.GREY, panel, border_radius=15)
+            for text, pos in zip(self.help_text, lines):
+                g.WIN.blit(text, pos)
+
+    def invalidate(self, rect=None):
+        """Mark rect, or the whole window, to be redrawn"""
+        if rect is None:
+            self.full_redraw = True
+        else:
+            self.dirty.append(pg.Rect(rect))
+
+    def dirty_rects(self, score_rects, tt_rect):
+        """Collect the areas that change in this frame"""
+        dirty = self.dirty + self.frame.dirty_rects()
+        self.dirty = []
+        dirty.extend(animation.extent() for animation in timeline.changed)
+        if self.score != self.drawn_score:
+            dirty.extend(self.drawn_score_rects + score_rects)
+        if self.turn_text is not self.drawn_turn_text:
+            dirty.extend([self.drawn_turn_rect, tt_rect])
+        if self.show_help != self.drawn_help:
+            self.full_redraw = True
+
+        if self.full_redraw:
+            self.full_redraw = False
+            return [g.WIN.get_rect()]
+        return [rect for rect in dirty if rect is not None]
 
     def draw(self):
+        layout = self.layout
+        tt_pos = layout.turn_pos(self.turn_text.get_size())
+        scorex = self.text.render(str(self.score[0]), 72)
+        scoreo = self.text.render(str(self.score[1]), 72)
+        score_pos = [
+            layout.score_pos(0, scorex.get_size()),
+            layout.score_pos(1, scoreo.get_size()),
+        ]
+        # One pixel of slack for the rounding of the positions
+        tt_rect = self.turn_text.get_rect(topleft=tt_pos).inflate(2, 2)
+        score_rects = [
+            scorex.get_rect(topleft=score_pos[0]).inflate(2, 2),
+            scoreo.get_rect(topleft=score_pos[1]).inflate(2, 2),
+        ]
+
+        # Only redraw and update the parts of the window that change
+        dirty = self.dirty_rects(score_rects, tt_rect)
+        self.timer.mark("dirty")
+        if not dirty:
+            return False
+        g.WIN.set_clip(dirty[0].unionall(dirty[1:]))
+
         g.WIN.fill(g.BLACK)
-        
-        tt_width = self.turn_text.get_width()
-        tt_height = self.turn_text.get_height()
-        tt_rect = (
-            (g.WIDTH - g.FRAME_GAP * g.GRID_COLS - 2 * tt_width) / 4,
-            (g.HEIGHT * 0.5 - g.FRAME_GAP * g.GRID_ROWS/2 - tt_height) // 2
-        )
         g.WIN.blit(
-            self.turn_text, tt_rect
+            self.turn_text, tt_pos
         )
+        self.timer.mark("widgets")
         self.frame.draw()
-        self.circle_orange.update()
-        self.circle_red.update()
-        scorex = self.font.render(str(self.score[0]), True, g.WHITE)
-        scoreo = self.font.render(str(self.score[1]), True, g.WHITE)
-        g.WIN.blit(
-            scorex,
-            (
-                (g.WIDTH - g.FRAME_GAP * g.GRID_COLS - 2 * scorex.get_width()) / 4,
-                (g.HEIGHT / 2 + g.FRAME_GAP / 4),
-            ),
-        )
-        sc_width = scorex.get_width()
-        g.WIN.blit(
-            scoreo,
-            (
-                g.WIDTH - (g.WIDTH - g.FRAME_GAP * g.GRID_COLS + 2 * sc_width) / 4,
-                (g.HEIGHT / 2 + g.FRAME_GAP / 4),
-            ),
-        )
+        self.timer.mark("board")
+        self.circle_orange.draw()
+        self.circle_red.draw()
+        g.WIN.blit(scorex, score_pos[0])
+        g.WIN.blit(scoreo, score_pos[1])
         self.draw_help()
-        pg.draw.rect(g.WIN, g.GREY, self.reset_rect)
+        reset_rect = layout.reset_rect
+        pg.draw.rect(g.WIN, g.GREY, reset_rect)
         pg.draw.circle(
             g.WIN,
             g.GREY,
-            (int(self.reset_rect.x), int(self.reset_rect.centery)),
-            self.reset_rect.height // 2,
+            (int(reset_rect.x), int(reset_rect.centery)),
+            reset_rect.height // 2,
         )
         pg.draw.circle(
             g.WIN,
             g.GREY,
-            (int(self.reset_rect.right), int(self.reset_rect.centery)),
-            self.reset_rect.height // 2,
-        )
-        g.WIN.blit(
-            self.reset_text,
-            (
-                g.WIDTH / 2 - self.reset_text.get_width() / 2,
-                g.HEIGHT - self.reset_text.get_height() - 70,
-            ),
+            (int(reset_rect.right), int(reset_rect.centery)),
+            reset_rect.height // 2,
         )
-        pg.display.update()
+        g.WIN.blit(self.reset_text, layout.reset_text_pos)
+        self.draw_timings()
+        g.WIN.set_clip(None)
+        self.timer.mark("widgets")
+
+        self.drawn_score = list(self.score)
+        self.drawn_score_rects = score_rects
+        self.drawn_turn_text = self.turn_text
+        self.drawn_turn_rect = tt_rect
+        self.drawn_help = self.show_help
+
+        if g.DEBUG_DIRTY:
+            for rect in dirty:
+                pg.draw.rect(g.WIN, g.DIRTY_COLOR, rect, 1)
+        pg.display.update(dirty)
+        self.timer.mark("update")
+        return True
+
+    def update_timings(self, now=False):
+        """Refresh the timing overlay twice a second while it's shown"""
+        ticks = pg.time.get_ticks()
+        if not now and (not self.show_timings or
+                        ticks - self.timings_time < 500):
+            return
+        self.timings_time = ticks
+        if self.timings_rect is not None:
+            self.invalidate(self.timings_rect)
+
+        summary = self.timer.summary(g.FPS)
+        if not self.show_timings or summary is None:
+            self.timings_text = []
+            self.timings_rect = None
+            return
+        font = self.text.font(24)
+        self.timings_text = [
+            font.render(line, True, g.WHITE) for line in (
+                "frame p50 %.1f ms  p95 %.1f ms  p99 %.1f ms" % (
+                    1000 * summary["p50"], 1000 * summary["p95"],
+                    1000 * summary["p99"]),
+                "missed %d of %d frames at %d fps" % (
+                    summary["missed"], summary["frames"], g.FPS),
+            )
+        ]
+        height = sum(text.get_height() for text in self.timings_text)
+        width = max(text.get_width() for text in self.timings_text)
+        self.timings_rect = pg.Rect(10, g.HEIGHT - height - 10, width,
+                                    height)
+        self.invalidate(self.timings_rect)
+
+    def draw_timings(self):
+        if not self.timings_text:
+            return
+        y = self.timings_rect.y
+        for text in self.timings_text:
+            g.WIN.blit(text, (self.timings_rect.x, y))
+            y += text.get_height()
+
+    def dump_timings(self, path):
+        """Write the recent frame timings to path for offline analysis"""
+        self.timer.dump(path)
+
+    def wait_for_input(self):
+        """Sleep until an event arrives, nothing on screen is changing"""
+        start = time.perf_counter()
+        if self.journal:
+            # The canvas turns GTK events into pygame events
+            Gtk.main_iteration_do(True)
+        else:
+            self.pending_events.append(pg.event.wait())
+        self.idle_time += time.perf_counter() - start
+
+    def idle_percentage(self):
+        """Share of the running time spent waiting for input"""
+        elapsed = time.perf_counter() - self.run_start
+        return 100 * self.idle_time / elapsed if elapsed > 0 else 0.0
 
     def reset(self):
-        self.frame = Frame(self, (g.WIDTH / 2, g.HEIGHT / 2))
+        self.frame = Frame(self, self.layout.board_center)
         self.set_turn()
+        self.update_hover()
+        self.invalidate()
+
+    def resize(self):
+        """Lay the screen out for the current window size.
+
+        Called once at startup and again only when the window is
+        resized, drawing just looks the positions up.
+        """
+        # Keep the board clear of the reset button
+        reset_width, reset_height = self.reset_text.get_size()
+        g.init(reserve=reset_height + 80)
+        self.layout = Layout(g.WIDTH, g.HEIGHT, g.FRAME_GAP,
+                             (reset_width, reset_height))
+        self.circle_orange = Animate(self, color=g.ORANGE).circle(
+            self.layout.markers[0],
+            30,
+            0  # Filled circle
+        )
+        self.circle_red = Animate(self, color=g.RED).circle(
+            self.layout.markers[1],
+            30,
+            0  # Filled circle
+        )
+        if self.frame is not None:
+            # Skip the intro, only the positions changed
+            for circle in (self.circle_orange, self.circle_red):
+                circle.step(timeline.now, skip=True)
+            self.frame.resize(self.layout.board_center, g.FRAME_GAP)
+            self.update_hover()
+            self.update_timings(True)
+        self.invalidate()
 
     def set_turn(self):
-        self.turn_text = pg.font.Font(None, 64).render(
+        self.turn_text = self.text.render(
             [_("Red Turn"), "", _("Orange Turn")][self.frame.turn + 1],
-            True,
-            g.WHITE
+            64
         )
 
     # The main loop
     def run(self):
-        if not pg.get_init():
-            pg.init()
-        if not pg.font.get_init():
-            pg.font.init()
+        # Only the display is needed up front, fonts are loaded by
+        # self.text when they are first used
+        if not pg.display.get_init():
+            pg.display.init()
         for event in pg.event.get():
             if event.type == pg.VIDEORESIZE:
                 pg.display.set_mode(event.size, pg.RESIZABLE)
                 break
-        g.init()
-        pg.font.init()
-        
-        self.reset_text = pg.font.Font(None, 56).render(
-            _("Reset"),
-            True,
-            g.WHITE
-        )
-        self.question_text = pg.font.Font(None, 72).render("?", True, g.WHITE)
-        self.close_text = pg.font.Font(None, 64).render("X", True, g.WHITE)
-        
-        # Create help text renderings
-        self.help_text = [
-            pg.font.Font(None, 36).render(
-                i,
-                True,
-                g.WHITE,
-            )
-            for i in (
-                _("Players take turns dropping colored tokens from the top."),
-                _("The tokens fall to the lowest available space in the column."),
-                _("The first player to get four tokens in a row (horizontally,"),
-                _("vertically, or diagonally) wins the game!"),
-            )
-        ]
-        
-        # Set up positions and rectangles
-        self.help_pos = pg.Rect(
-            (3 * g.WIDTH + g.FRAME_GAP * g.GRID_COLS) // 4 - 40,
-            (g.HEIGHT * 0.5 - g.FRAME_GAP * g.GRID_ROWS/2) // 2 - 40,
-            80,
-            80,
-        )
-        self.reset_rect = pg.Rect(
-            g.WIDTH / 2 - self.reset_text.get_width() / 2,
-            g.HEIGHT - self.reset_text.get_height() - 80,
-            self.reset_text.get_width(),
-            self.reset_text.get_height() + 20,
-        )
-        
-        # Font and animation objects
-        self.font = pg.font.Font(None, 72)
-        self.circle_orange = Animate(self, color=g.ORANGE).circle(
-            (
-                (g.WIDTH - g.FRAME_GAP * g.GRID_COLS) / 4,
-                g.HEIGHT / 2 - g.FRAME_GAP / 4
-            ),
-            30,
-            0  # Filled circle
-        )
-        self.circle_red = Animate(self, color=g.RED).circle(
-            (
-                g.WIDTH - (g.WIDTH - g.FRAME_GAP * g.GRID_COLS) / 4,
-                g.HEIGHT / 2 - g.FRAME_GAP / 4
-            ),
-            30,
-            0  # Filled circle
-        )
+        self.reset_text = self.text.render(_("Reset"), 56)
+        self.resize()
         
         # Initialize turn text
-        self.turn_text = pg.font.Font(None, 64).render(_("Red Turn"), True, g.WHITE)
+        self.turn_text = self.text.render(_("Red Turn"), 64)
 
         if self.canvas is not None:
             self.canvas.grab_focus()
 
         self.reset()
+        if self.saved is not None:
+            self.restore()
         self.clock = pg.time.Clock()
+        self.run_start = time.perf_counter()
         while self.running:
+            timer = self.timer
+            timer.start_frame()
             if self.journal:
                 # Pump GTK messages.
                 while Gtk.events_pending():
                     Gtk.main_iteration()
+            timer.mark("gtk")
 
+            timeline.tick()
+            timer.mark("timeline")
             self.check_events()
-            self.draw()
+            timer.mark("events")
+            self.play_computer()
+            timer.mark("computer")
+            drawn = self.draw()
+            if drawn and self.startup_time is None:
+                self.startup_time = time.perf_counter() - START_TIME
+                logging.info("First frame %.0f ms after loading",
+                             1000 * self.startup_time)
+            if self.running and not drawn and not self.computer_turn():
+                self.wait_for_input()
+                timer.mark("idle")
             self.clock.tick(g.FPS)
+            timer.mark("tick")
+            timer.end_frame()
+            self.update_timings()
+        logging.info("Idle %.1f%% of the time", self.idle_percentage())
+        if g.TIMINGS_FILE:
+            self.dump_timings(g.TIMINGS_FILE)
+        if self.search is not None:
+            self.search.close()
         pg.display.quit()
         pg.quit()
         sys.exit(0)
@@ -263,4 +464,5 @@ class Main:
 if __name__ == "__main__":
     pg.init()
     pg.display.set_mode((1024, 768))
-    Main().run()
\ No newline at end of file
+    # No GTK main loop outside Sugar, wait on pygame events instead
+    Main(journal=False).run()
\ No newline at end of file
@@ -0,0 +1,344 @@
+# parallel.py
+
+"""Searching for the computer opponent in worker processes.
+
+ParallelSearch searches the first root move itself and every other
+one in its own task on a process pool, against the score of the first.
+It is only used from the command line below, to measure the parallel
+search. The game plays with BackgroundSearch, which runs a time limited
+iterative deepening search in the background so the game keeps drawing
+while the computer thinks.
+
+The workers share one transposition table that lives in an anonymous
+shared memory mapping created before the pool forks, so a position
+solved by one worker is a cache hit for all the others.
+
+Each slot holds two 64 bit words, the key XOR-ed with the data and the
+data itself. A slot torn by two workers writing at once no longer
+decodes to its key and reads as a miss, so no locks are needed.
+
+Try it from a shell with:
+
+    python3 parallel.py --workers 4 --depth 10
+"""
+
+import argparse
+import mmap
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import ai
+from board import Board
+from book import OpeningBook
+
+VALUE_OFFSET = 1 << 31
+MASK64 = (1 << 64) - 1
+
+
+class SharedTable:
+    """Lockless transposition table in shared memory.
+
+    It has the same interface as ai.TranspositionTable.
+    """
+
+    def __init__(self, size=1 << 20):
+        self.size = 1 << (size.bit_length() - 1)
+        self.map = mmap.mmap(-1, self.size * 16)
+        self.slots = memoryview(self.map).cast("Q")
+        self.generation = 0
+
+    def clear(self):
+        self.map[:] = bytes(len(self.map))
+        self.generation = 0
+
+    def new_search(self):
+        self.generation += 1
+
+    def close(self):
+        self.slots.release()
+        self.map.close()
+
+    @staticmethod
+    def pack(depth, flag, value, move, generation):
+        move_index = move.bit_length() if move else 0
+        return ((value + VALUE_OFFSET) |
+                depth << 32 |
+                flag << 40 |
+                move_index << 42 |
+                (generation & 0x3f) << 58)
+
+    def get(self, key):
+        slot = 2 * (key & (self.size - 1))
+        data = self.slots[slot + 1]
+        if self.slots[slot] ^ data != key or not data:
+            return None
+        move_index = (data >> 42) & 0xffff
+        return (
+            key,
+            (data >> 32) & 0xff,
+            (data >> 40) & 0x3,
+            (data & 0xffffffff) - VALUE_OFFSET,
+            1 << (move_index - 1) if move_index else None,
+            data >> 58,
+        )
+
+    def put(self, key, depth, flag, value, move):
+        slot = 2 * (key & (self.size - 1))
+        old = self.slots[slot + 1]
+        if (old and self.slots[slot] ^ old != key and
+                depth < (old >> 32) & 0xff and
+                old >> 58 == self.generation & 0x3f):
+            return
+        data = self.pack(depth, flag, value, move, self.generation)
+        self.slots[slot] = (key ^ data) & MASK64
+        self.slots[slot + 1] = data
+
+
+_engine = None
+
+
+def _init_worker(rows, cols, connect, level, seed, table, book_path=None):
+    global _engine
+    _engine = ai.Engine(rows, cols, level, table_size=1, seed=seed,
+                        connect=connect)
+    _engine.table = table
+    if book_path is not None:
+        _engine.book = OpeningBook(book_path)
+
+
+def _pool(engine, workers, table):
+    # The shared table is handed over by forking, so the workers need
+    # the fork start method.
+    book_path = engine.book.path if engine.book is not None else None
+    return ProcessPoolExecutor(
+        workers,
+        mp_context=multiprocessing.get_context("fork"),
+        initializer=_init_worker,
+        initargs=(engine.rows, engine.cols, engine.connect, engine.level,
+                  engine.seed, table, book_path),
+    )
+
+
+def _score_move(engine, position, mask, count, key, side, depth, alpha):
+    """Score one root move, the position is seen from the opponent.
+
+    A move no better than alpha only gets an upper bound for its score.
+    """
+    engine.nodes = 0
+    start = time.perf_counter()
+    score = -engine.negamax(position, mask, count, key, side, depth,
+                            -ai.WIN_SCORE - 1, -alpha)
+    return score, engine.nodes, time.perf_counter() - start, os.getpid()
+
+
+def _search_move(position, mask, count, key, side, depth, generation,
+                 alpha):
+    _engine.table.generation = generation
+    return _score_move(_engine, position, mask, count, key, side, depth,
+                       alpha)
+
+
+def _think(board, player, depth, budget, helper, generation):
+    col, depth = _engine.search(board, player, depth, budget, helper,
+                                generation)
+    return col, depth, _engine.nodes
+
+
+class _Workers:
+    """Process pool and the shared table its workers search with, both
+    created on first use"""
+
+    def __init__(self, engine, workers, table_size):
+        self.engine = engine
+        self.workers = workers
+        self.table_size = table_size
+        self.table = None
+        self.pool = None
+
+    def start_pool(self):
+        if self.pool is None:
+            self.table = SharedTable(self.table_size)
+            self.pool = _pool(self.engine, self.workers, self.table)
+
+    def close(self, wait=True):
+        """Shut the pool down and free the table.
+
+        Without wait, tasks not started yet are cancelled.
+        """
+        if self.pool is not None:
+            self.pool.shutdown(wait=wait, cancel_futures=not wait)
+            # The workers have their own mapping, the table can go now
+            self.table.close()
+            self.pool = None
+            self.table = None
+
+    def set_level(self, level):
+        self.engine.set_level(level)
+
+
+class ParallelSearch(_Workers):
+    """Drop-in replacement for Engine.best_move that uses a process pool"""
+
+    def __init__(self, engine, workers=None, table_size=1 << 20):
+        super().__init__(engine, workers or os.cpu_count() or 1, table_size)
+        self.report = []  # Per worker statistics of the last search
+
+    def start(self):
+        self.start_pool()
+
+    def best_move(self, board, player, depth=None):
+        engine = self.engine
+        if depth is None:
+            depth = engine.depth
+
+        position, mask, count, key = engine.position(board, player)
+        possible = (mask + engine.bottom) & engine.board_mask
+        if not possible:
+            return None
+        # Immediate wins and book moves need no search
+        col = engine.quick_move(position, mask)
+        if col is not None:
+            return col
+
+        self.start()
+        self.table.new_search()
+        side = board.index(player)
+        moves = []
+        for col in engine.order:
+            move = possible & engine.column_masks[col]
+            if move:
+                moves.append((col, (
+                    position ^ mask, mask | move, count + 1,
+                    engine.child_key(key, side, move), 1 - side, depth - 1,
+                )))
+
+        # The first move, the center when it's free, is searched here
+        # with a full window. Its score is the bound the workers search
+        # the other moves against, so they can cut them short.
+        col, child = moves[0]
+        table = engine.table
+        engine.table = self.table
+        try:
+            first = _score_move(engine, *child, -ai.WIN_SCORE - 1)
+        finally:
+            engine.table = table
+        futures = [
+            (col, self.pool.submit(_search_move, *child,
+                                   self.table.generation, first[0]))
+            for col, child in moves[1:]
+        ]
+
+        stats = {}
+        best_col = None
+        best_score = None
+        results = [(moves[0][0], first)]
+        results += [(col, future.result()) for col, future in futures]
+        for col, (score, nodes, seconds, pid) in results:
+            worker = stats.setdefault(pid, [0, 0, 0.0])
+            worker[0] += 1
+            worker[1] += nodes
+            worker[2] += seconds
+            if best_score is None or score > best_score:
+                best_score = score
+                best_col = col
+
+        self.report = [
+            {
+                "pid": pid,
+                "moves": moves,
+                "nodes": nodes,
+                "seconds": seconds,
+                "nps": nodes / seconds if seconds else 0.0,
+            }
+            for pid, (moves, nodes, seconds) in sorted(stats.items())
+        ]
+        return best_col
+
+
+class BackgroundSearch(_Workers):
+    """Time limited search that doesn't block the caller.
+
+    start() hands a position to the workers and poll() returns the
+    chosen column once they are done. With several workers, all of them
+    search the same position through the shared table, each starting
+    with a different root move, and the deepest finished search wins.
+    """
+
+    def __init__(self, engine, workers=1, budget=1.0, table_size=1 << 20):
+        super().__init__(engine, max(1, workers), table_size)
+        self.budget = budget  # Seconds per move
+        self.futures = []
+        self.position = None
+        self.report = []  # (depth, nodes) per worker of the last search
+
+    def busy(self):
+        return bool(self.futures)
+
+    def start(self, board, player):
+        self.start_pool()
+        self.position = (tuple(board.masks), player)
+        # Every worker searches in the same generation, so none of them
+        # takes the entries of the others for stale ones
+        self.table.new_search()
+        self.futures = [
+            self.pool.submit(_think, board, player, self.engine.depth,
+                             self.budget, helper, self.table.generation)
+            for helper in range(self.workers)
+        ]
+
+    def poll(self, board, player):
+        """The column to play, or None while the workers are searching.
+
+        Results for any other position than the one passed to start()
+        are thrown away.
+        """
+        if not self.futures or not all(f.done() for f in self.futures):
+            return None
+        results = [f.result() for f in self.futures]
+        self.futures = []
+        self.report = [(depth, nodes) for _, depth, nodes in results]
+        if self.position != (tuple(board.masks), player):
+            return None
+
+        # The deepest search wins, the first worker breaks ties
+        col, depth, _ = results[0]
+        for result in results[1:]:
+            if result[1] > depth:
+                col, depth, _ = result
+        return col
+
+    def close(self):
+        # Don't keep the game waiting for a search nobody needs
+        super().close(wait=False)
+        self.futures = []
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Parallel search benchmark")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--depth", type=int, default=10)
+    parser.add_argument("--rows", type=int, default=6)
+    parser.add_argument("--cols", type=int, default=7)
+    args = parser.parse_args(argv)
+
+    search = ParallelSearch(ai.Engine(args.rows, args.cols), args.workers)
+    try:
+        start = time.perf_counter()
+        col = search.best_move(Board(args.rows, args.cols), 1, args.depth)
+        elapsed = time.perf_counter() - start
+    finally:
+        search.close()
+
+    total = 0
+    for worker in search.report:
+        total += worker["nodes"]
+        print("worker %(pid)d: %(moves)d moves, %(nodes)d nodes, "
+              "%(nps).0f nodes/s" % worker)
+    print("best column %d, %d nodes in %.2f s, %.0f nodes/s" %
+          (col, total, elapsed, total / elapsed))
+
+
+if __name__ == "__main__":
+    main()
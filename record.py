@@ -0,0 +1,114 @@
+# record.py
+
+"""Saved games for the Sugar journal.
+
+A record is a fixed size header with the board size and the scores,
+then the columns played in the current game packed into as few bits as
+the board width needs (3 bits per move on the standard board), then a
+CRC-32 of everything before it. Records are written and checked in
+chunks, so saving never builds the whole file in memory.
+"""
+
+import struct
+import zlib
+
+MAGIC = b"C4GR"
+VERSION = 1
+
+# magic, version, rows, cols, connect, first player, scores, move count
+HEADER = struct.Struct("<4sBBBBbxxxIII")
+CHECKSUM = struct.Struct("<I")
+CHUNK = 4096  # Bytes of moves written at a time
+
+
+def bits_per_move(cols):
+    return max(1, (cols - 1).bit_length())
+
+
+class GameRecord:
+    def __init__(self, rows, cols, connect=4, first=1, score=(0, 0),
+                 moves=()):
+        self.rows = rows
+        self.cols = cols
+        self.connect = connect
+        self.first = first  # Player who started the current game
+        self.score = list(score)
+        self.moves = list(moves)  # Columns played in the current game
+
+    @classmethod
+    def from_game(cls, game, score):
+        board = game.board
+        first = game.turn if len(game.history) % 2 == 0 else -game.turn
+        return cls(board.rows, board.cols, board.connect, first, score,
+                   game.history)
+
+    def write(self, f):
+        """Write the record to the binary file f"""
+        header = HEADER.pack(MAGIC, VERSION, self.rows, self.cols,
+                             self.connect, self.first, self.score[0],
+                             self.score[1], len(self.moves))
+        f.write(header)
+        crc = zlib.crc32(header)
+
+        bits = bits_per_move(self.cols)
+        chunk = bytearray()
+        acc = 0  # Bits not written yet, the first move in the low bits
+        count = 0
+        for col in self.moves:
+            acc |= col << count
+            count += bits
+            while count >= 8:
+                chunk.append(acc & 0xff)
+                acc >>= 8
+                count -= 8
+            if len(chunk) >= CHUNK:
+                f.write(chunk)
+                crc = zlib.crc32(chunk, crc)
+                chunk = bytearray()
+        if count:
+            chunk.append(acc)
+        f.write(chunk)
+        crc = zlib.crc32(chunk, crc)
+        f.write(CHECKSUM.pack(crc))
+
+    @classmethod
+    def read(cls, f):
+        """Read a record from the binary file f"""
+        header = f.read(HEADER.size)
+        if len(header) < HEADER.size:
+            raise ValueError("Truncated game record")
+        (magic, version, rows, cols, connect, first, score0, score1,
+         count) = HEADER.unpack(header)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("Not a game record")
+
+        bits = bits_per_move(cols)
+        data = f.read((count * bits + 7) // 8)
+        checksum = f.read(CHECKSUM.size)
+        if len(checksum) < CHECKSUM.size:
+            raise ValueError("Truncated game record")
+        if CHECKSUM.unpack(checksum)[0] != zlib.crc32(data,
+                                                      zlib.crc32(header)):
+            raise ValueError("Corrupted game record")
+
+        mask = (1 << bits) - 1
+        moves = []
+        acc = 0
+        available = 0
+        for byte in data:
+            acc |= byte << available
+            available += 8
+            while available >= bits and len(moves) < count:
+                moves.append(acc & mask)
+                acc >>= bits
+                available -= bits
+        return cls(rows, cols, connect, first, (score0, score1), moves)
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            self.write(f)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            return cls.read(f)
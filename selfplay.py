@@ -0,0 +1,226 @@
+# selfplay.py
+
+"""Self-play games for training and analysis.
+
+Games between two engines are played on a process pool and every
+position is appended to a file of fixed size records: both players'
+bitboards, the side to move, the column it played, the ply and the
+final result for the side to move. The file can be memory-mapped with
+Dataset and is only ever appended to, so several runs can add to the
+same file. A record cut short by an interrupted run is cut off before
+the next run appends.
+
+Games are played with game.Game, the rules the activity itself uses.
+The engines always pick the same move in the same position, so games
+open with a few random moves, or take random moves with some noise,
+to be different from each other.
+Only a few batches of games are in flight at a time, so memory stays
+flat however many games are played.
+
+Try it from a shell with:
+
+    python3 selfplay.py --games 1000 --first hard --second medium \\
+        --random-plies 4 -o selfplay.bin
+"""
+
+import argparse
+import mmap
+import os
+import random
+import struct
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import ai
+from game import Game
+
+MAGIC = b"C4SP"
+VERSION = 1
+
+# magic, version, rows, cols, connect
+HEADER = struct.Struct("<4sBBBB")
+# player 1 mask, player -1 mask, column played, side to move, result
+# for the side to move (1 win, 0 draw, -1 loss), ply
+RECORD = struct.Struct("<QQBbbB")
+
+RANDOM = "random"  # Engine name for a player that picks random moves
+
+
+class Dataset:
+    """Memory-mapped positions of a self-play file"""
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "rb")
+        try:
+            self.map = mmap.mmap(self.file.fileno(), 0,
+                                 access=mmap.ACCESS_READ)
+        except ValueError:
+            self.file.close()
+            raise ValueError("Empty self-play file %s" % path)
+
+        magic, version, self.rows, self.cols, self.connect = \
+            HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError("Not a self-play file: %s" % path)
+        # A record cut short by an interrupted run is left out
+        self.count = (len(self.map) - HEADER.size) // RECORD.size
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        if not 0 <= index < self.count:
+            raise IndexError(index)
+        return RECORD.unpack_from(self.map,
+                                  HEADER.size + index * RECORD.size)
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+
+_size = None
+_engines = None
+
+
+def _init_worker(rows, cols, connect, players):
+    global _size, _engines
+    _size = (rows, cols, connect)
+    _engines = [
+        None if level == RANDOM else
+        ai.Engine(rows, cols, level, connect=connect)
+        for level in players
+    ]
+
+
+def _play_games(seed, games, random_plies, noise):
+    """Play a batch of games and return their packed records"""
+    rng = random.Random(seed)
+    data = bytearray()
+    positions = 0
+    for number in range(games):
+        game = Game(*_size)
+        # The engines take turns to start
+        starter = (seed + number) & 1
+        played = []
+        while not game.is_over():
+            board = game.board
+            engine = _engines[starter ^ (game.turn == -1)]
+            if (engine is None or board.count < random_plies or
+                    rng.random() < noise):
+                col = rng.choice(game.legal_moves())
+            else:
+                col = engine.best_move(board, game.turn)
+            played.append((board.masks[0], board.masks[1], col, game.turn,
+                           board.count))
+            game.play(col)
+
+        for mask0, mask1, col, player, ply in played:
+            data += RECORD.pack(mask0, mask1, col, player,
+                                game.winner * player, ply)
+        positions += len(played)
+    return bytes(data), games, positions
+
+
+def generate(path, games, rows=6, cols=7, connect=4, players=("hard",) * 2,
+             workers=None, batch=32, random_plies=4, noise=0.0, seed=0,
+             log=None):
+    """Play games and append their positions to the file at path.
+
+    Returns the number of positions written.
+    """
+    if cols * (rows + 1) > 64:
+        raise ValueError("Board too large for 64 bit records")
+    for level in players:
+        if level != RANDOM and level not in ai.LEVELS:
+            raise ValueError("Unknown level %r" % level)
+    if RANDOM not in players and not random_plies and not noise:
+        raise ValueError("Two engines without random moves play the same "
+                         "few games over and over")
+    workers = workers or os.cpu_count() or 1
+
+    header = HEADER.pack(MAGIC, VERSION, rows, cols, connect)
+    if os.path.exists(path) and os.path.getsize(path):
+        with open(path, "r+b") as f:
+            if f.read(HEADER.size) != header:
+                raise ValueError("%s holds games of another kind" % path)
+            # Drop a record cut short by an interrupted run, or the new
+            # records would not line up
+            size = os.fstat(f.fileno()).st_size
+            f.truncate(size - (size - HEADER.size) % RECORD.size)
+
+    batches = iter(range(0, games, batch))
+    written = 0
+    played = 0
+    start = last_report = time.perf_counter()
+    with open(path, "ab") as f, ProcessPoolExecutor(
+            workers, initializer=_init_worker,
+            initargs=(rows, cols, connect, players)) as pool:
+        if not f.tell():
+            f.write(header)
+
+        def submit():
+            first = next(batches, None)
+            if first is not None:
+                pending.add(pool.submit(
+                    _play_games, seed + first, min(batch, games - first),
+                    random_plies, noise))
+
+        # Only a couple of batches per worker are in flight at a time
+        pending = set()
+        for _ in range(2 * workers):
+            submit()
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                data, count, positions = future.result()
+                f.write(data)
+                played += count
+                written += positions
+                submit()
+
+            now = time.perf_counter()
+            if log is not None and (now - last_report > 5 or not pending):
+                last_report = now
+                log("%d games, %d positions, %.1f games/s" %
+                    (played, written, played / (now - start)))
+    return written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Self-play games")
+    parser.add_argument("-o", "--output", default="selfplay.bin")
+    parser.add_argument("--games", type=int, default=1000)
+    parser.add_argument("--rows", type=int, default=6)
+    parser.add_argument("--cols", type=int, default=7)
+    parser.add_argument("--connect", type=int, default=4)
+    levels = sorted(ai.LEVELS) + [RANDOM]
+    parser.add_argument("--first", default=ai.DEFAULT_LEVEL, choices=levels)
+    parser.add_argument("--second", default=ai.DEFAULT_LEVEL,
+                        choices=levels)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--batch", type=int, default=32,
+                        help="games per task")
+    parser.add_argument("--random-plies", type=int, default=4,
+                        help="open every game with this many random moves")
+    parser.add_argument("--noise", type=float, default=0.0,
+                        help="chance of a random move after the opening")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    def log(message):
+        print(message, file=sys.stderr)
+
+    try:
+        generate(args.output, args.games, args.rows, args.cols,
+                 args.connect, (args.first, args.second), args.workers,
+                 args.batch, args.random_plies, args.noise, args.seed, log)
+    except ValueError as e:
+        parser.error(str(e))
+
+
+if __name__ == "__main__":
+    main()
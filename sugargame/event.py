@@ -21,6 +21,7 @@
 #
 
 import logging
+from collections import deque
 from gi.repository import GLib
 from gi.repository import Gdk
 import pygame
@@ -32,6 +33,57 @@ class _MockEvent(object):
         self.keyval = keyval
 
 
+# pygame keycodes by the name after K_, looked up once
+_pygame_keys = dict((name[2:], getattr(pygame, name))
+                    for name in dir(pygame) if name.startswith('K_'))
+
+# Results of Translator._keycode() other than a keycode, or None for
+# keys pygame has no keycode for
+_NO_NAME = object()      # GDK has no name for the keyval
+_VIEW_SOURCE = object()  # The view source key
+
+
+# SDL 2 keycodes of keys without a character, such as K_LCTRL, are
+# this plus the key's scancode
+_SCANCODE_MASK = 1 << 30
+
+
+class _KeyState(object):
+    """Pressed keys, indexed by pygame keycode like the sequence
+    pygame.key.get_pressed() returns.
+
+    Character keys have keycodes below 128. The other keys of pygame 2
+    have huge keycodes, those are folded into the slots after them, so
+    the state is a fixed number of slots whatever the keycode.
+    """
+
+    size = 128 + 512  # Character keys, then every SDL scancode
+
+    def __init__(self):
+        self._pressed = bytearray(self.size)
+
+    def _slot(self, keycode):
+        if keycode >= _SCANCODE_MASK:
+            keycode += 128 - _SCANCODE_MASK
+        elif keycode < 0:
+            keycode += self.size
+        if not 0 <= keycode < self.size:
+            raise IndexError('key state index out of range')
+        return keycode
+
+    def __getitem__(self, keycode):
+        return bool(self._pressed[self._slot(keycode)])
+
+    def __setitem__(self, keycode, pressed):
+        self._pressed[self._slot(keycode)] = 1 if pressed else 0
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        return (bool(pressed) for pressed in self._pressed)
+
+
 class Translator(object):
     key_trans = {
         'Alt_L': pygame.K_LALT,
@@ -100,14 +152,22 @@ class Translator(object):
         self._inner_evb.connect('screen-changed', self._screen_changed_cb)
 
         # Internal data
-        self.__keystate = [0] * 323
+        self.__keystate = _KeyState()
+        self.__keycodes = {}  # Keyval to keycode, see _keycode()
         self.__button_state = [0, 0, 0]
         self.__mouse_pos = (0, 0)
         self.__repeat = (None, None)
         self.__held = set()
-        self.__held_time_left = {}
-        self.__held_last_time = {}
-        self.__tick_id = None
+        self.__repeat_ids = {}  # Keyval to its repeat timer
+        self.__motion = None  # Latest pointer motion not posted yet
+        self.__motion_id = None
+        self.__backlog = deque()  # Events waiting for room in the queue
+        self.__retry_id = None
+
+        # Pointer notifications merged into one MOUSEMOTION, and events
+        # lost because the pygame queue was full
+        self.coalesced_motions = 0
+        self.dropped_events = 0
 
     def hook_pygame(self):
         pygame.key.get_pressed = self._get_pressed
@@ -117,21 +177,23 @@ class Translator(object):
 
     def update_display(self):
         if pygame.display.get_init():
-            pygame.event.post(pygame.event.Event(pygame.VIDEOEXPOSE))
+            self._post(pygame.event.Event(pygame.VIDEOEXPOSE))
 
     def _resize_cb(self, widget, event):
         if pygame.display.get_init():
             evt = pygame.event.Event(pygame.VIDEORESIZE,
                                      size=(event.width, event.height),
                                      width=event.width, height=event.height)
-            pygame.event.post(evt)
+            self._post(evt)
         return False  # continue processing
 
     def _screen_changed_cb(self, widget, previous_screen):
         self.update_display()
 
     def _quit_cb(self, data=None):
-        pygame.event.post(pygame.event.Event(pygame.QUIT))
+        logging.debug('%d motion events coalesced, %d events dropped',
+                      self.coalesced_motions, self.dropped_events)
+        self._post(pygame.event.Event(pygame.QUIT))
 
     def _visibility_cb(self, widget, event):
         self.update_display()
@@ -143,20 +205,14 @@ class Translator(object):
             return True
         else:
             if self.__repeat[0] is not None:
-                self.__held_last_time[key] = pygame.time.get_ticks()
-                self.__held_time_left[key] = self.__repeat[0]
+                self._start_repeat(key)
             self.__held.add(key)
 
         return self._keyevent(widget, event, pygame.KEYDOWN)
 
     def _keyup_cb(self, widget, event):
         key = event.keyval
-        if self.__repeat[0] is not None:
-            if key in self.__held:
-                # This is possibly false if set_repeat()
-                # is called with a key held
-                del self.__held_time_left[key]
-                del self.__held_last_time[key]
+        self._stop_repeat(key)
         self.__held.discard(key)
 
         return self._keyevent(widget, event, pygame.KEYUP)
@@ -167,24 +223,39 @@ class Translator(object):
             mod |= self.__keystate[key_val] and mod_val
         return mod
 
-    def _keyevent(self, widget, event, type):
-        key = Gdk.keyval_name(event.keyval)
+    def _keycode(self, keyval):
+        """The pygame keycode for a GDK keyval, worked out once per key"""
+        try:
+            return self.__keycodes[keyval]
+        except KeyError:
+            pass
+
+        key = Gdk.keyval_name(keyval)
         if key is None:
             # No idea what this key is.
-            return False
-
-        keycode = None
-        if key in self.key_trans:
+            keycode = _NO_NAME
+        elif key in self.key_trans:
             keycode = self.key_trans[key]
-        elif hasattr(pygame, 'K_' + key.upper()):
-            keycode = getattr(pygame, 'K_' + key.upper())
-        elif hasattr(pygame, 'K_' + key.lower()):
-            keycode = getattr(pygame, 'K_' + key.lower())
+        elif key.upper() in _pygame_keys:
+            keycode = _pygame_keys[key.upper()]
+        elif key.lower() in _pygame_keys:
+            keycode = _pygame_keys[key.lower()]
         elif key == 'XF86Start':
-            # view source request, specially handled...
-            self._activity.view_source()
+            keycode = _VIEW_SOURCE
         else:
             logging.error('Key %s unrecognized' % key)
+            keycode = None
+        self.__keycodes[keyval] = keycode
+        return keycode
+
+    def _keyevent(self, widget, event, type):
+        keycode = self._keycode(event.keyval)
+        if keycode is _NO_NAME:
+            return False
+        if keycode is _VIEW_SOURCE:
+            # view source request, specially handled...
+            self._activity.view_source()
+            return True
 
         if keycode is not None:
             if type == pygame.KEYDOWN:
@@ -221,16 +292,45 @@ class Translator(object):
         return True
 
     def _mousemove_cb(self, widget, event):
-        # From http://www.learningpython.com/2006/07/25/writing-a-custom-widget-using-pygtk/
-        # if this is a hint, then let's get all the necessary
-        # information, if not it's all we need.
+        # GTK can send many motion notifications per frame. Only the
+        # latest one is kept and posted once GTK has handled the events
+        # waiting, so the game sees at most one MOUSEMOTION per frame.
         if event.is_hint:
-            win, x, y, state = event.window.get_device_position(event.device)
+            # Asking for the position is a round trip to the X server,
+            # it's done once when the motion is posted
+            motion = (event.window, event.device)
+        else:
+            motion = (event.x, event.y, event.get_state())
+
+        if self.__motion is None:
+            self.__motion_id = GLib.idle_add(self._motion_idle_cb)
+        else:
+            self.coalesced_motions += 1
+        self.__motion = motion
+        return True
+
+    def _motion_idle_cb(self):
+        self.__motion_id = None
+        self._flush_motion()
+        return False
+
+    def _flush_motion(self):
+        """Post the pending pointer motion, if there is one"""
+        motion = self.__motion
+        if motion is None:
+            return
+        self.__motion = None
+        if self.__motion_id is not None:
+            GLib.source_remove(self.__motion_id)
+            self.__motion_id = None
+
+        if len(motion) == 2:
+            window, device = motion
+            win, x, y, state = window.get_device_position(device)
         else:
-            x = event.x
-            y = event.y
-            state = event.get_state()
+            x, y, state = motion
 
+        # rel is the sum of the moves since the last MOUSEMOTION
         rel = (x - self.__mouse_pos[0], y - self.__mouse_pos[1])
         self.__mouse_pos = (x, y)
 
@@ -243,40 +343,79 @@ class Translator(object):
         evt = pygame.event.Event(pygame.MOUSEMOTION,
                                  pos=self.__mouse_pos, rel=rel,
                                  buttons=self.__button_state)
-        self._post(evt)
-        return True
-
-    def _tick_cb(self):
-        cur_time = pygame.time.get_ticks()
-        for key in self.__held:
-            delta = cur_time - self.__held_last_time[key]
-            self.__held_last_time[key] = cur_time
-
-            self.__held_time_left[key] -= delta
-            if self.__held_time_left[key] <= 0:
-                self.__held_time_left[key] = self.__repeat[1]
-                self._keyevent(None, _MockEvent(key), pygame.KEYDOWN)
-
+        self.__backlog.append(evt)
+        self._drain()
+
+    def _start_repeat(self, key):
+        # Every held key has its own timer, so nothing wakes up while
+        # no key is held
+        delay, interval = self.__repeat
+        self.__repeat_ids[key] = GLib.timeout_add(delay, self._repeat_cb,
+                                                  key, interval)
+
+    def _stop_repeat(self, key):
+        source_id = self.__repeat_ids.pop(key, None)
+        if source_id is not None:
+            GLib.source_remove(source_id)
+
+    def _repeat_cb(self, key, interval):
+        self._keyevent(None, _MockEvent(key), pygame.KEYDOWN)
+        if interval is not None:
+            # The delay is over, repeat at the interval from now on
+            self.__repeat_ids[key] = GLib.timeout_add(
+                interval, self._repeat_cb, key, None)
+            return False
         return True
 
     def _set_repeat(self, delay=None, interval=None):
-        if delay is not None and self.__repeat[0] is None:
-            self.__tick_id = GLib.timeout_add(10, self._tick_cb)
-        elif delay is None and self.__repeat[0] is not None:
-            GLib.source_remove(self.__tick_id)
+        # Like pygame, no delay or a delay of 0 turns repeat off
+        if not delay:
+            delay = interval = None
+        elif not interval:
+            interval = delay
+        if (delay, interval) == self.__repeat:
+            return
+        # Keys held now don't repeat until they are pressed again
+        for key in list(self.__repeat_ids):
+            self._stop_repeat(key)
         self.__repeat = (delay, interval)
 
     def _get_mouse_pos(self):
         return self.__mouse_pos
 
     def _post(self, evt):
-        try:
-            pygame.event.post(evt)
-        except pygame.error as e:
-            if str(e) == 'video system not initialized':
-                pass
-            elif str(e) == 'Event queue full':
-                logging.error("Event queue full!")
-                pass
-            else:
-                raise e
+        # Motion that happened before evt goes first
+        self._flush_motion()
+        self.__backlog.append(evt)
+        self._drain()
+
+    def _drain(self):
+        """Post the waiting events in order, as long as there's room"""
+        while self.__backlog:
+            evt = self.__backlog[0]
+            try:
+                pygame.event.post(evt)
+            except pygame.error as e:
+                if str(e) == 'video system not initialized':
+                    pass
+                elif str(e).startswith('Event queue'):
+                    # 'Event queue full', or with SDL 2 'Event queue is
+                    # full (65535 events)'
+                    if evt.type != pygame.MOUSEMOTION:
+                        # Keys, buttons and the rest are never lost, try
+                        # again once the game has emptied the queue
+                        if self.__retry_id is None:
+                            self.__retry_id = GLib.timeout_add(
+                                10, self._retry_cb)
+                        return
+                    # A newer motion will follow, this one can go
+                    logging.error("Event queue full!")
+                    self.dropped_events += 1
+                else:
+                    raise e
+            self.__backlog.popleft()
+
+    def _retry_cb(self):
+        self.__retry_id = None
+        self._drain()
+        return False
@@ -0,0 +1,124 @@
+# test_record.py
+
+"""Checks of the saved game format and of resuming from it.
+
+Run from this directory with:
+
+    python3 -m unittest test_record
+"""
+
+import os
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import io
+import unittest
+
+import pygame as pg
+
+import g
+from anim import timeline
+from frame import Frame
+from record import CHUNK, HEADER, GameRecord, bits_per_move
+
+
+def pack(record):
+    f = io.BytesIO()
+    record.write(f)
+    return f.getvalue()
+
+
+def unpack(data):
+    return GameRecord.read(io.BytesIO(data))
+
+
+class GameRecordTest(unittest.TestCase):
+    def assertSameRecord(self, a, b):
+        self.assertEqual(
+            (a.rows, a.cols, a.connect, a.first, a.score, a.moves),
+            (b.rows, b.cols, b.connect, b.first, b.score, b.moves))
+
+    def test_layout(self):
+        # Saved games must keep loading, this pins the format down
+        record = GameRecord(6, 7, 4, 1, (2, 3), [3, 3, 4])
+        self.assertEqual(HEADER.size, 24)
+        self.assertEqual(
+            pack(record).hex(),
+            "4334475201060704010000000200000003000000030000001b01"
+            "6d1c9820")
+
+    def test_round_trip(self):
+        # 2, 7 and 100 columns take 1, 3 and 7 bits per move
+        for cols, bits in ((2, 1), (7, 3), (100, 7)):
+            self.assertEqual(bits_per_move(cols), bits)
+            for count in (0, 1, 7, 8, 9, CHUNK * 8 // bits + 5):
+                moves = [(i * 5 + count) % cols for i in range(count)]
+                record = GameRecord(6, cols, 4, -1, (1, 65536), moves)
+                data = pack(record)
+                self.assertEqual(len(data),
+                                 HEADER.size + (count * bits + 7) // 8 + 4)
+                self.assertSameRecord(unpack(data), record)
+
+    def test_truncated(self):
+        data = pack(GameRecord(6, 7, 4, 1, (0, 0), [3, 2, 3, 4]))
+        for size in (0, 10, HEADER.size, len(data) - 1):
+            with self.assertRaises(ValueError):
+                unpack(data[:size])
+
+    def test_not_a_record(self):
+        data = bytearray(pack(GameRecord(6, 7)))
+        data[0:4] = b"XXXX"
+        with self.assertRaisesRegex(ValueError, "Not a game record"):
+            unpack(bytes(data))
+
+    def test_corrupted(self):
+        data = pack(GameRecord(6, 7, 4, 1, (0, 0), [3, 2, 3, 4]))
+        for index in (5, HEADER.size, len(data) - 1):
+            damaged = bytearray(data)
+            damaged[index] ^= 0x10
+            with self.assertRaisesRegex(ValueError, "Corrupted"):
+                unpack(bytes(damaged))
+
+
+class FrameLoadTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        pg.display.init()
+        pg.display.set_mode((1200, 900))
+        g.init()
+        timeline.__init__()
+
+    @classmethod
+    def tearDownClass(cls):
+        pg.display.quit()
+
+    def tokens(self, frame):
+        return [(row, col, token.type)
+                for row, line in enumerate(frame.moves)
+                for col, token in enumerate(line) if token is not None]
+
+    def test_load(self):
+        frame = Frame(None, (600, 450))
+        frame.load(-1, [3, 3, 4])
+        bottom = g.GRID_ROWS - 1
+        self.assertEqual(self.tokens(frame), [
+            (bottom - 1, 3, 1), (bottom, 3, -1), (bottom, 4, -1)])
+        self.assertEqual(frame.game.history, [3, 3, 4])
+        self.assertEqual(frame.turn, 1)
+
+    def test_illegal_column(self):
+        # Replaying stops at the first move that can't be played
+        frame = Frame(None, (600, 450))
+        frame.load(1, [3, g.GRID_COLS, 2])
+        self.assertEqual(frame.game.history, [3])
+        self.assertEqual(self.tokens(frame), [(g.GRID_ROWS - 1, 3, 1)])
+
+    def test_full_column(self):
+        frame = Frame(None, (600, 450))
+        frame.load(1, [0] * (g.GRID_ROWS + 1) + [1])
+        self.assertEqual(frame.game.history, [0] * g.GRID_ROWS)
+
+
+if __name__ == "__main__":
+    unittest.main()
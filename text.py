@@ -0,0 +1,52 @@
+# text.py
+
+"""Cache of rendered text.
+
+Loading a font reads it from disk and rendering text allocates a new
+surface, so both are done once and reused: fonts are pooled per size
+and rendered surfaces are kept in a small LRU cache.
+"""
+
+import os
+from collections import OrderedDict
+
+import pygame as pg
+import g
+
+
+def language():
+    return os.environ.get("LANGUAGE") or os.environ.get("LANG", "")
+
+
+class TextCache:
+    def __init__(self, capacity=64):
+        self.capacity = capacity
+        self.fonts = {}
+        self.surfaces = OrderedDict()
+
+    def font(self, size):
+        """The default font at the given size, loaded on first use"""
+        font = self.fonts.get(size)
+        if font is None:
+            if not pg.font.get_init():
+                pg.font.init()
+            font = self.fonts[size] = pg.font.Font(None, size)
+        return font
+
+    def render(self, text, size, color=g.WHITE):
+        """Render text, reusing the surface from an earlier call"""
+        key = (text, size, tuple(color), language())
+        surface = self.surfaces.get(key)
+        if surface is not None:
+            self.surfaces.move_to_end(key)
+            return surface
+
+        surface = self.font(size).render(text, True, color)
+        self.surfaces[key] = surface
+        if len(self.surfaces) > self.capacity:
+            self.surfaces.popitem(last=False)
+        return surface
+
+    def clear(self):
+        self.fonts.clear()
+        self.surfaces.clear()
@@ -0,0 +1,95 @@
+# timing.py
+
+"""Where the time of each frame goes.
+
+FrameTimer keeps the time spent in every phase of the main loop for
+the last few hundred frames in a fixed size ring buffer, so measuring
+costs a few perf_counter() calls per frame and no allocations. The
+buffer can be summarized for the on-screen overlay or written to a CSV
+file for offline analysis.
+"""
+
+import time
+from array import array
+
+# Phases of one pass of the main loop, in order
+PHASES = (
+    "gtk",       # Pumping GTK events
+    "timeline",  # Stepping the animations
+    "events",    # check_events()
+    "computer",  # Starting and polling the computer's search
+    "dirty",     # Working out what to redraw
+    "board",     # Frame.draw()
+    "widgets",   # Text, scores and buttons
+    "update",    # pg.display.update()
+    "idle",      # Waiting for input, nothing to draw
+    "tick",      # clock.tick() keeping the frame rate
+)
+
+# Phases that don't count as work when looking for slow frames
+WAITING = ("idle", "tick")
+
+
+class FrameTimer:
+    def __init__(self, size=600):
+        self.size = size
+        self.times = array("d", bytes(8 * size * len(PHASES)))
+        self.index = {phase: i for i, phase in enumerate(PHASES)}
+        self.count = 0  # Frames finished so far
+        self.row = 0
+        self.last = time.perf_counter()
+
+    def start_frame(self):
+        self.row = (self.count % self.size) * len(PHASES)
+        for i in range(len(PHASES)):
+            self.times[self.row + i] = 0.0
+        self.last = time.perf_counter()
+
+    def mark(self, phase):
+        """Book the time since the last mark to phase"""
+        now = time.perf_counter()
+        self.times[self.row + self.index[phase]] += now - self.last
+        self.last = now
+
+    def end_frame(self):
+        self.count += 1
+
+    def frames(self):
+        """Rows of phase times in seconds, oldest first"""
+        stored = min(self.count, self.size)
+        first = self.count - stored
+        for frame in range(first, self.count):
+            row = (frame % self.size) * len(PHASES)
+            yield self.times[row:row + len(PHASES)]
+
+    def busy_times(self):
+        """Time of every stored frame without the waiting, in seconds"""
+        waiting = [self.index[phase] for phase in WAITING]
+        return [sum(t) - sum(t[i] for i in waiting) for t in self.frames()]
+
+    def summary(self, fps):
+        """Percentiles of the busy frame times and the missed frames"""
+        busy = sorted(self.busy_times())
+        if not busy:
+            return None
+        budget = 1.0 / fps if fps else None
+
+        def percentile(p):
+            return busy[min(len(busy) - 1, len(busy) * p // 100)]
+
+        return {
+            "frames": len(busy),
+            "p50": percentile(50),
+            "p95": percentile(95),
+            "p99": percentile(99),
+            "missed": sum(1 for t in busy if budget and t > budget),
+        }
+
+    def dump(self, path):
+        """Write the stored frames to path as CSV, in milliseconds"""
+        with open(path, "w") as f:
+            f.write("frame," + ",".join(PHASES) + "\n")
+            first = self.count - min(self.count, self.size)
+            for number, times in enumerate(self.frames(), first):
+                f.write("%d,%s\n" % (
+                    number, ",".join("%.3f" % (1000 * t) for t in times)))